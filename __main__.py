@@ -1,6 +1,13 @@
+from time import perf_counter
+
+# Before anything heavy gets imported
+launched = perf_counter()
+
 import asyncio
 import ssl
-from vandybot import startup, main
+from vandybot import startup, main, shutdown, startup_profile
+
+startup_profile.imported(launched)
 
 
 # Strange SSL shenanigans in 3.7; see https://github.com/aio-libs/aiohttp/issues/3535
@@ -29,6 +36,7 @@ if __name__ == '__main__':
     try:
         loop.run_until_complete(main())
     except KeyboardInterrupt:
+        loop.run_until_complete(shutdown())
         loop.close()
 
     print("VandyBot is shutting down...")
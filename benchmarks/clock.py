@@ -0,0 +1,56 @@
+# Times the Day/Time primitives and the renders that lean on them, with and without a clock snapshot
+# Run from the repository root: python -m benchmarks.clock
+import contextlib
+import timeit
+
+from benchmarks.snapshot import build_menu
+from vandybot.dining import Dining
+from vandybot.helper import Day, Time, clock, week
+
+NUMBER = 200
+REPEATS = 10
+
+
+def bench(name, func, snapshot=False):
+    def run():
+        with clock() if snapshot else contextlib.nullcontext():
+            func()
+
+    seconds = min(timeit.repeat(run, number=NUMBER, repeat=REPEATS)) / NUMBER
+    print(f"{name:<40}{seconds * 1e6:>10.1f} us")
+
+
+def main():
+    menu = build_menu()
+    unit_menu = menu["unit-0"]
+    meals = [meal for day_menu in unit_menu.values() for meal in day_menu.values()]
+
+    dining = Dining(None)
+    dining._menu = menu
+
+    def statuses():
+        for meal in meals:
+            meal.status
+
+    def arithmetic():
+        for day in week:
+            day + 1
+            day - 3
+            Day(str(day))
+
+    def parse():
+        for hour in range(1, 13):
+            Time(f"{hour}:00 AM")
+            Time(f"{hour}:30 PM")
+
+    bench("Day arithmetic and lookup", arithmetic)
+    bench("Time parsing", parse)
+    for snapshot in (False, True):
+        suffix = " (snapshot)" if snapshot else ""
+        bench(f"sorted(unit_menu.items()){suffix}", lambda: sorted(unit_menu.items()), snapshot)
+        bench(f"Meal.status x {len(meals)}{suffix}", statuses, snapshot)
+        bench(f"menu_list(unit){suffix}", lambda: dining.menu_list("unit-0"), snapshot)
+
+
+if __name__ == "__main__":
+    main()
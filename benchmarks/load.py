@@ -0,0 +1,211 @@
+# Fires a start-of-semester rush of commands and reaction toggles at the real cogs, with Discord faked out
+# Record fixtures first (python -m benchmarks.record), then run from the repository root: python -m benchmarks.load
+import asyncio
+import collections
+import itertools
+import random
+import types
+from time import perf_counter
+
+from benchmarks.record import Fixtures, cancel_leftovers, fail_fast, make_bot, scratch
+from benchmarks.standin import StandIn
+from vandybot.helper import clock, http_client, outbox, rss
+
+COMMANDS = 2000
+REACTIONS = 1000
+CHANNELS = 20
+
+# Everything arrives within this many seconds
+SPREAD = 2.0
+
+# How long each fake Discord call takes, and how long upstream takes
+DISCORD_DELAY = 0.05
+UPSTREAM_DELAY = 0.0
+
+LAG_INTERVAL = 0.01
+SEED = 583
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.calls = collections.Counter()
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel):
+        self.id = next(self._ids)
+        self.channel = channel
+
+    async def add_reaction(self, reaction):
+        await self._call("add_reaction")
+
+    async def edit(self, **kwargs):
+        await self._call("edit")
+
+    async def remove_reaction(self, reaction, member):
+        await self._call("remove_reaction")
+
+    async def _call(self, name):
+        self.channel.calls[name] += 1
+        await asyncio.sleep(DISCORD_DELAY)
+
+
+class FakeContext:
+    # Just enough of a commands.Context for the cogs
+    def __init__(self, channel, sent):
+        self.channel = channel
+        self._sent = sent
+
+    async def send(self, content=None, embed=None):
+        self.channel.calls["send"] += 1
+        await asyncio.sleep(DISCORD_DELAY)
+        message = FakeMessage(self.channel)
+        self._sent.append(message.id)
+        return message
+
+
+class Load:
+    def __init__(self, dining, hours):
+        self.dining = dining
+        self.hours = hours
+
+        self.channels = [FakeChannel(channel_id) for channel_id in range(CHANNELS)]
+        self.errors = collections.Counter()
+        self.lags = []
+        self.latencies = collections.defaultdict(list)
+        self.sent = []
+
+        stocked = {unit_slug for unit_slug in dining._menu if dining._menu[unit_slug]}
+        self.menu_args = [alias for alias, unit_slug in dining._unit_slugs.items() if unit_slug in stocked]
+        self.hours_args = [alias for table in (hours._dining, hours._libraries, hours._post_offices,
+                                               hours._bookstores, hours._recs) for alias in table]
+        self.extra_args = [(), (), ("tomorrow",), ("list",), *((meal,) for meal in dining._meal_slugs)]
+
+    async def invoke(self, name, callback, cog, delay, *args):
+        await asyncio.sleep(delay)
+        ctx = FakeContext(random.choice(self.channels), self.sent)
+
+        start = perf_counter()
+        try:
+            # Same as on_message
+            with clock():
+                await callback(cog, ctx, *args)
+        except Exception as error:
+            # BadArgument and friends would have gone to on_command_error
+            self.errors[type(error).__name__] += 1
+        finally:
+            self.latencies[name].append(perf_counter() - start)
+
+    async def monitor(self):
+        while True:
+            start = perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lags.append(perf_counter() - start - LAG_INTERVAL)
+
+    async def toggle(self, delay):
+        await asyncio.sleep(delay)
+        if not self.sent:
+            return
+
+        payload = types.SimpleNamespace(message_id=random.choice(self.sent), user_id=0,
+                                        emoji=types.SimpleNamespace(name=random.choice(list(self.dining._reactions))))
+        for handler in (self.dining.on_raw_reaction_add, self.dining.on_raw_reaction_remove):
+            start = perf_counter()
+            # Same as the bot-level dispatch
+            if self.dining.cached(payload.message_id):
+                await handler(payload)
+            self.latencies["reaction"].append(perf_counter() - start)
+            await asyncio.sleep(random.uniform(0, 0.5))
+
+    async def run(self):
+        random.seed(SEED)
+        monitor = asyncio.ensure_future(self.monitor())
+
+        # Evicted messages get their reactions cleaned up, same as in production
+        cleanup = asyncio.ensure_future(self.dining.cleanup_reactions())
+        memory = rss()
+
+        jobs = []
+        for _ in range(COMMANDS):
+            delay = random.uniform(0, SPREAD)
+            if random.random() < 0.6:
+                args = (random.choice(self.menu_args), *random.choice(self.extra_args))
+                jobs.append(self.invoke("~menu", self.dining.menu.callback, self.dining, delay, *args))
+            else:
+                jobs.append(self.invoke("~hours", self.hours.hours.callback, self.hours, delay,
+                                        random.choice(self.hours_args)))
+
+        jobs += [self.toggle(random.uniform(0, SPREAD)) for _ in range(REACTIONS)]
+
+        start = perf_counter()
+        await asyncio.gather(*jobs)
+        elapsed = perf_counter() - start
+
+        # Cleanup goes one call at a time on purpose, so it would take forever to finish
+        cleanup.cancel()
+        backlog = self.dining._cleanup.qsize()
+
+        # Let the debounced edits and the decorations land
+        await asyncio.sleep(self.dining.EDIT_DELAY)
+        while len(outbox):
+            await asyncio.sleep(0.1)
+
+        drained = perf_counter() - start - elapsed
+        monitor.cancel()
+
+        print(f"Ran {COMMANDS} commands and {REACTIONS} reaction toggles in {elapsed:.2f}s "
+              f"({(COMMANDS + REACTIONS) / elapsed:.0f}/s), and Discord caught up {drained:.2f}s later\n")
+        print(f"{'':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, latencies in self.latencies.items():
+            print(f"{name:<12}{len(latencies):>8}" +
+                  "".join(f"{percentile(latencies, fraction) * 1000:>10.1f}" for fraction in (0.5, 0.95, 0.99, 1)))
+
+        print(f"\nEvent loop lag: p50 {percentile(self.lags, 0.5) * 1000:.1f} ms, "
+              f"p99 {percentile(self.lags, 0.99) * 1000:.1f} ms, max {max(self.lags) * 1000:.1f} ms")
+        print(f"Memory: {memory / 2 ** 20:.1f} MB to {rss() / 2 ** 20:.1f} MB resident, "
+              f"{len(self.dining._cache)} menu messages cached, {backlog} waiting on reaction cleanup")
+        print(f"Errors: {dict(self.errors) or 'none'}")
+
+        calls = sum((channel.calls for channel in self.channels), collections.Counter())
+        print(f"Fake Discord calls: {dict(calls)}")
+        print(f"Outbox: {outbox}")
+
+
+async def run(dining, hours, stand_in):
+    await stand_in.start()
+    stand_in.point(dining, hours)
+    fail_fast(dining, "The stand-in could not answer everything, so record the fixtures again.")
+    await dining.get_menu()
+
+    if stand_in.stats["missing"]:
+        raise SystemExit(f"The stand-in was missing {stand_in.stats['missing']} responses, "
+                         f"so record the fixtures again.")
+
+    await Load(dining, hours).run()
+    print(f"Stand-in served {stand_in}")
+
+    cancel_leftovers()
+    await stand_in.close()
+    await http_client.close()
+
+
+def main():
+    fixtures = Fixtures()
+    if not len(fixtures):
+        raise SystemExit("No fixtures yet. Record some with python -m benchmarks.record first.")
+
+    with scratch():
+        bot, dining, hours = make_bot()
+        bot.loop.run_until_complete(run(dining, hours, StandIn(fixtures, UPSTREAM_DELAY)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Replays the recorded fixtures through each stage of the scrape-and-render pipeline
+# Record fixtures first (python -m benchmarks.record), then run from the repository root: python -m benchmarks.pipeline
+import contextlib
+import io
+import os
+import statistics
+import tracemalloc
+from time import perf_counter
+
+from benchmarks.record import Fixtures, cancel_leftovers, fail_fast, make_bot, scratch
+from benchmarks.standin import StandIn
+from vandybot.dining import _dir as dining_dir
+from vandybot.helper import Validators, clock, http_client, unit_name
+from vandybot.hours import UnitClosed
+
+FETCH_NUMBER = 20
+RENDER_NUMBER = 200
+
+# Bump this to pretend upstream is as slow as it really is
+DELAY = 0.0
+
+
+async def measure(name, func, number, setup=None):
+    latencies = []
+    for _ in range(number):
+        if setup is not None:
+            setup()
+
+        start = perf_counter()
+        await func()
+        latencies.append(perf_counter() - start)
+
+    # Separate pass so tracing doesn't slow down the timings
+    if setup is not None:
+        setup()
+
+    tracemalloc.start()
+    await func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    print(f"{name:<36}{number / sum(latencies):>10.1f}{statistics.median(latencies) * 1000:>10.2f}"
+          f"{latencies[int(0.95 * (number - 1))] * 1000:>10.2f}{peak / 1024:>12.1f}{retained / 1024:>12.1f}")
+
+
+def rendered(func):
+    # Commands render inside a clock snapshot, so these do too
+    async def run():
+        with clock():
+            func()
+
+    return run
+
+
+async def run(dining, hours, stand_in):
+    await stand_in.start()
+    stand_in.point(dining, hours)
+    fail_fast(dining, "The stand-in could not answer everything, so record the fixtures again.")
+
+    def cold():
+        # Forget every validator so each week comes down in full
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{dining_dir}/validators.json")
+        dining._validators = Validators(f"{dining_dir}/validators.json", version=dining.parse_version,
+                                        encode=dining.encode_week, decode=dining.decode_week)
+
+    async def get_menu():
+        with contextlib.redirect_stdout(io.StringIO()):
+            await dining.get_menu()
+
+    print(f"{'stage':<36}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>12}{'kept KB':>12}")
+    await measure("get_menu (cold)", get_menu, FETCH_NUMBER, cold)
+    await measure("get_menu (warm, 304s)", get_menu, FETCH_NUMBER)
+
+    # The same units the menu refresh asks about
+    units = [unit_name(unit_slug) for unit_slug in dining._menu]
+    libraries = sorted(set(hours._libraries.values()))
+    await measure(f"prefetch_dining_hours x {len(units)}", lambda: hours.prefetch_dining_hours(units), FETCH_NUMBER)
+    await measure("get_dining_hours (expired)", lambda: hours.get_dining_hours(units[0]), FETCH_NUMBER,
+                  lambda: hours._dining_hours.invalidate(units[0]))
+    await measure("get_library_hours (expired)", lambda: hours.get_library_hours(libraries[0]), FETCH_NUMBER,
+                  hours._library_hours.invalidate)
+
+    stocked = [unit_slug for unit_slug in dining._menu if dining._menu[unit_slug]]
+    meals = [(unit_slug, meal) for unit_slug in stocked
+             for day_menu in dining._menu[unit_slug].values() for meal in day_menu.values()]
+    restrictions = [{name} for name in dining._reactions]
+
+    def filter_items():
+        for unit_slug, meal in meals:
+            for restriction in restrictions:
+                dining.filter_items(unit_slug, meal, restriction)
+
+    def menu_dispatch():
+        for unit_slug, meal in meals:
+            with contextlib.suppress(UnitClosed):
+                dining.menu_dispatch(unit_slug, meal, set())
+
+    def menu_list():
+        dining.menu_list()
+        for unit_slug in stocked:
+            with contextlib.suppress(UnitClosed):
+                dining.menu_list(unit_slug)
+                for day in dining._menu[unit_slug]:
+                    dining.menu_list(unit_slug, day)
+
+    def forget_filtered():
+        for _, meal in meals:
+            meal.filtered.clear()
+
+    await measure(f"filter_items x {len(meals) * len(restrictions)}", rendered(filter_items), RENDER_NUMBER,
+                  forget_filtered)
+    await measure(f"menu_dispatch x {len(meals)}", rendered(menu_dispatch), RENDER_NUMBER)
+    await measure(f"menu_list x {len(stocked)} units", rendered(menu_list), RENDER_NUMBER)
+
+    print(f"\nStand-in served {stand_in}")
+    cancel_leftovers()
+    await stand_in.close()
+    await http_client.close()
+
+
+def main():
+    fixtures = Fixtures()
+    if not len(fixtures):
+        raise SystemExit("No fixtures yet. Record some with python -m benchmarks.record first.")
+
+    with scratch():
+        bot, dining, hours = make_bot()
+        bot.loop.run_until_complete(run(dining, hours, StandIn(fixtures, DELAY)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Records live responses from every upstream site into fixtures for the offline benchmarks
+# Run from the repository root (with network access): python -m benchmarks.record
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import urllib.parse
+
+from discord.ext import commands
+from yarl import URL
+
+from vandybot.dining import Dining
+from vandybot.helper import SessionPool, http_client
+from vandybot.hours import Hours
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# NutriSlice weeks are requested by their Sunday's date
+WEEK_PATH = re.compile(r"(/menu/api/weeks/\S*?/)(\d{4})/(\d{1,2})/(\d{1,2})/")
+
+
+def normalize(query):
+    # Same parameters in any order should find the same fixture
+    if isinstance(query, dict):
+        query = urllib.parse.urlencode(query)
+
+    return urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(query or "", keep_blank_values=True)))
+
+
+def fixture_key(method, host, path, query="", body=""):
+    return " ".join((method, host, path, normalize(query), normalize(body)))
+
+
+def fail_fast(dining, message):
+    async def give_up():
+        raise SystemExit(message)
+
+    # Retrying for real would take the better part of an hour
+    dining.retry = give_up
+
+
+def make_bot():
+    # A real bot that never connects, so the cogs find each other like they normally would
+    bot = commands.Bot(command_prefix="~")
+    bot.add_cog(Dining(bot))
+    bot.add_cog(Hours(bot))
+    return bot, bot.get_cog("Dining"), bot.get_cog("Hours")
+
+
+def cancel_leftovers():
+    # get_menu schedules tomorrow's refresh, which nobody here wants
+    for task in asyncio.all_tasks():
+        if task is not asyncio.current_task():
+            task.cancel()
+
+
+def relative_key(key, date):
+    # Weeks become offsets from date's week, so fixtures recorded last month still line up
+    def offset(match):
+        week = datetime.date(*map(int, match.groups()[1:]))
+        return f"{match[1]}{(week - sunday(date)).days // 7:+d}w/"
+
+    return WEEK_PATH.sub(offset, key)
+
+
+@contextlib.contextmanager
+def scratch():
+    # The cogs read and write relative to the repository root, so give them a copy to mess up
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp()
+    shutil.copytree("vandybot", os.path.join(directory, "vandybot"),
+                    ignore=shutil.ignore_patterns("*.py", "__pycache__", "*.pickle", "*.snapshot", "validators.json"))
+    os.chdir(directory)
+    try:
+        yield directory
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+
+def sunday(date):
+    return date - datetime.timedelta(days=date.isoweekday() % 7)
+
+
+class Fixtures:
+    def __init__(self, directory=FIXTURES):
+        self.directory = directory
+
+        # key: {"status", "content_type", "charset", "file"}
+        self.index = {}
+        self.recorded = datetime.date.today()
+        if os.path.exists(os.path.join(directory, "index.json")):
+            with open(os.path.join(directory, "index.json")) as index_file:
+                saved = json.load(index_file)
+
+            # Older indexes are just the responses, from an unknown week
+            self.index = saved.get("responses", saved)
+            self.recorded = datetime.date.fromisoformat(saved.get("recorded", self.recorded.isoformat()))
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, key, status, content_type, charset, body):
+        filename = hashlib.sha1(key.encode()).hexdigest()[:16] + ".bin"
+        with open(os.path.join(self.directory, filename), "wb") as body_file:
+            body_file.write(body)
+
+        self.index[key] = {"status": status, "content_type": content_type, "charset": charset, "file": filename}
+
+    def load(self):
+        # Relative key: (status, content_type, charset, body)
+        responses = {}
+        for key, entry in self.index.items():
+            with open(os.path.join(self.directory, entry["file"]), "rb") as body_file:
+                responses[relative_key(key, self.recorded)] = \
+                    entry["status"], entry["content_type"], entry["charset"], body_file.read()
+
+        return responses
+
+    def save(self):
+        with open(os.path.join(self.directory, "index.json"), "w") as index_file:
+            json.dump({"recorded": self.recorded.isoformat(), "responses": self.index}, index_file,
+                      indent=2, sort_keys=True)
+
+
+class RecordingSession:
+    # Passes everything through to the real client, keeping a copy of each response
+    def __init__(self, session, fixtures):
+        self._session = session
+        self._fixtures = fixtures
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, **kwargs):
+        full_url = URL(url).update_query(kwargs["params"]) if kwargs.get("params") else URL(url)
+        async with getattr(self._session, method.lower())(url, **kwargs) as response:
+            body = await response.read()
+            self._fixtures.add(fixture_key(method, full_url.host, full_url.path, full_url.query_string,
+                                           kwargs.get("data")),
+                               response.status, response.content_type, response.charset, body)
+            yield response
+
+    def session(self):
+        # For the NetNutrition session pool
+        return RecordingSession(self._session.session(), self._fixtures)
+
+
+async def record(dining, hours, fixtures):
+    recorder = RecordingSession(http_client, fixtures)
+    dining._session = hours._session = recorder
+    hours._sessions = SessionPool(recorder, hours.POOL_SIZE, hours.reset)
+    fail_fast(dining, "Could not reach NutriSlice, so nothing was recorded.")
+
+    # Week offsets are counted from today, so start over
+    fixtures.index.clear()
+    fixtures.recorded = datetime.date.today()
+
+    # Schools, every week, the NetNutrition home page and every unit's hours
+    await dining.get_menu()
+    await hours.load_library_hours()
+    await dining.get_food_truck_index()
+
+    # Let the session pool finish its resets so those get recorded too
+    await asyncio.sleep(1)
+    cancel_leftovers()
+
+
+def main():
+    os.makedirs(FIXTURES, exist_ok=True)
+    fixtures = Fixtures()
+    with scratch():
+        bot, dining, hours = make_bot()
+        try:
+            bot.loop.run_until_complete(record(dining, hours, fixtures))
+        finally:
+            bot.loop.run_until_complete(http_client.close())
+
+    fixtures.save()
+    print(f"\nRecorded {len(fixtures)} responses into {FIXTURES}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Compares the menu snapshot format against pickling the whole menu
+# Run from the repository root: python -m benchmarks.snapshot
+import os
+import pickle
+import random
+import tempfile
+import timeit
+
+from vandybot.dining import Catalog, Item, Meal, Menu
+from vandybot.helper import Time, week
+
+UNITS = 12
+MEALS = ("breakfast", "lunch", "dinner", "daily-offerings")
+STATIONS = 8
+ITEMS_PER_STATION = 10
+FOODS = 800
+REPEATS = 20
+
+
+def build_menu():
+    random.seed(583)
+    catalog = Catalog({})
+    foods = [catalog.intern(Item(food_id, f"Food #{food_id}", random.getrandbits(14))) for food_id in range(FOODS)]
+
+    menu = Menu([f"unit-{index}" for index in range(UNITS)], catalog)
+    for unit_menu in menu.values():
+        for day in week:
+            day_menu = unit_menu[day] = {}
+            for meal_slug in MEALS:
+                meal = day_menu[meal_slug] = Meal(meal_slug, day)
+                meal.opens, meal.closes = Time("7:00 AM"), Time("8:00 PM")
+                meal.hours_status, meal.items_status = Meal.HOURS_AVAILABLE, Meal.ITEMS_AVAILABLE
+                meal.items = {f"Station {station}": random.sample(foods, ITEMS_PER_STATION)
+                              for station in range(STATIONS)}
+
+    return menu
+
+
+def bench(name, func):
+    seconds = min(timeit.repeat(func, number=1, repeat=REPEATS))
+    print(f"{name:<32}{seconds * 1000:>10.2f} ms")
+
+
+def main():
+    menu = build_menu()
+    directory = tempfile.mkdtemp()
+    pickle_name = os.path.join(directory, "menu.pickle")
+    snapshot_name = os.path.join(directory, "menu.snapshot")
+
+    def pickle_save():
+        with open(pickle_name, "wb") as menu_pickle:
+            pickle.dump(dict(menu), menu_pickle)
+
+    def pickle_load():
+        with open(pickle_name, "rb") as menu_pickle:
+            return pickle.load(menu_pickle)
+
+    def snapshot_load_all():
+        loaded = Menu.load(snapshot_name, Catalog({}))
+        for unit_slug in loaded.snapshot:
+            if unit_slug.startswith("unit:"):
+                loaded[unit_slug[5:]]
+        loaded.close()
+
+    def snapshot_load_one():
+        loaded = Menu.load(snapshot_name, Catalog({}))
+        loaded["unit-0"]
+        loaded.close()
+
+    bench("pickle save", pickle_save)
+    bench("snapshot save", lambda: menu.save(snapshot_name))
+    bench("pickle load", pickle_load)
+    bench("snapshot load (every unit)", snapshot_load_all)
+    bench("snapshot load (one unit)", snapshot_load_one)
+
+    print(f"\n{'pickle size':<32}{os.path.getsize(pickle_name) / 1024:>10.1f} KB")
+    print(f"{'snapshot size':<32}{os.path.getsize(snapshot_name) / 1024:>10.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# A local stand-in for every upstream site, serving the recorded fixtures
+import asyncio
+import collections
+import datetime
+import hashlib
+
+from aiohttp import web
+from yarl import URL
+
+from benchmarks.record import Fixtures, fixture_key, relative_key
+
+
+class StandIn:
+    def __init__(self, fixtures=None, delay=0.0):
+        self.delay = delay
+        self.stats = collections.Counter()
+        self.url = None
+
+        self._responses = (fixtures or Fixtures()).load()
+        self._runner = None
+
+    def __str__(self):
+        return ", ".join(f"{count} {name}" for name, count in self.stats.items())
+
+    def local(self, url):
+        # https://host/path becomes http://127.0.0.1:port/host/path
+        url = URL(url)
+        return f"{self.url}/{url.host}{url.path if url.path != '/' else ''}"
+
+    def point(self, dining, hours):
+        # Aims the cogs here instead of at the real sites
+        dining.MENU_URL = self.local(dining.MENU_URL)
+        dining.FOOD_TRUCK_URL = self.local(dining.FOOD_TRUCK_URL)
+        hours.DINING_URL = self.local(hours.DINING_URL)
+        hours.DINING_HEADER = {"Referer": hours.DINING_URL}
+        hours.LIBRARY_URL = self.local(hours.LIBRARY_URL)
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    async def handle(self, request):
+        self.stats["requests"] += 1
+        if self.delay:
+            # Upstream is never this fast
+            await asyncio.sleep(self.delay)
+
+        body = await request.text()
+        key = relative_key(fixture_key(request.method, request.match_info["host"], "/" + request.match_info["path"],
+                                       request.query_string, body), datetime.date.today())
+        try:
+            status, content_type, charset, data = self._responses[key]
+        except KeyError:
+            self.stats["missing"] += 1
+            return web.Response(status=404)
+
+        etag = f'"{hashlib.sha1(data).hexdigest()[:16]}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.stats["not modified"] += 1
+            return web.Response(status=304)
+
+        return web.Response(status=status, body=data, content_type=content_type, charset=charset,
+                            headers={"ETag": etag})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{host}/{path:.*}", self.handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
@@ -17,6 +17,9 @@ tokens = env_file.get()
 DEBUGGING = tokens.get("DEBUGGING", "False") == "True"
 DEBUG_GUILD_ID = int(tokens.get("DEBUG_GUILD_ID", "0"))
 
+# Zero means no metrics endpoint
+METRICS_PORT = int(tokens.get("METRICS_PORT", "0"))
+
 TOKEN = tokens.get("BOT_TOKEN")
 if DEBUGGING:
     TOKEN = tokens.get("DEBUG_BOT_TOKEN", TOKEN)
@@ -25,6 +28,7 @@ if DEBUGGING:
 @bot.event
 async def on_ready():
     print("VandyBot has connected. Awaiting command requests...")
+    startup_profile.ready()
     text = DEFAULT_TEXT if not DEBUGGING else "Currently undergoing maintenance"
     await bot.change_presence(activity=presence(text))
 
@@ -33,7 +37,8 @@ async def on_ready():
 async def on_message(message):
     if not message.author.bot:
         if not DEBUGGING or message.guild.id == DEBUG_GUILD_ID:
-            await bot.process_commands(message)
+            with clock():
+                await bot.process_commands(message)
 
 
 if not DEBUGGING:
@@ -47,7 +52,25 @@ if not DEBUGGING:
                 name, value = type(error).__name__, str(error)
 
             embed.add_field(name=name, value=value)
-            await ctx.send(embed=embed)
+            await outbox.send(ctx, embed=embed)
+
+
+@bot.before_invoke
+async def before_invoke(ctx):
+    ctx.started = perf_counter()
+    profiler.begin("commands")
+
+
+@bot.after_invoke
+async def after_invoke(ctx):
+    name = ctx.command.qualified_name
+    metrics.observe("vandybot_command_seconds", perf_counter() - ctx.started, command=name)
+    metrics.count("vandybot_commands_total", command=name, outcome="failed" if ctx.command_failed else "ok")
+    profiler.end("commands")
+
+
+def debug_guild_only():
+    return commands.check(lambda ctx: ctx.guild is not None and ctx.guild.id == DEBUG_GUILD_ID)
 
 
 @bot.event
@@ -75,14 +98,46 @@ async def github(ctx):
     embed.set_thumbnail(url="https://github.githubassets.com/images/modules/logos_page/GitHub-Mark.png")
     embed.add_field(name="VandyBot is Open Source!", value="Check out the code on GitHub.")
 
-    await ctx.send(embed=embed)
+    await outbox.send(ctx, embed=embed)
 
 
 @bot.command(name="ping",
              brief="Pings the VandyBot client",
              help="Returns the current latency to the VandyBot client.")
 async def ping(ctx):
-    await ctx.send(f"~pong ({bot.latency * 1000:.3f}ms)")
+    await outbox.send(ctx, f"~pong ({bot.latency * 1000:.3f}ms)")
+
+
+@bot.command(name="profile",
+             hidden=True,
+             help="Samples the next few commands (~profile commands 5) or the next menu refresh (~profile refresh), "
+                  "then reports where the time went. Only works in the debug server.")
+@debug_guild_only()
+async def profile(ctx, target: str, count: int = 1):
+    if target not in ("commands", "refresh"):
+        raise commands.BadArgument(f"Can only profile commands or the refresh, not {target}.")
+
+    async def report(text):
+        await outbox.send(ctx, f"```\n{text[:1990]}```")
+
+    if not profiler.arm(target, max(count, 1), report):
+        await outbox.send(ctx, f"Already profiling: {profiler}")
+        return
+
+    await outbox.send(ctx, f"Profiler is {profiler}.")
+
+
+@bot.command(name="stats",
+             hidden=True,
+             help="Shows runtime metrics. Only works in the debug server.")
+@debug_guild_only()
+async def stats(ctx):
+    embed = Embed(title="VandyBot Stats", color=DEFAULT_COLOR)
+    for name, value in metrics.summary().items():
+        embed.add_field(name=name, value=value[:1024], inline=False)
+
+    embed.set_footer(text=f"Startup: {startup_profile}")
+    await outbox.send(ctx, embed=embed)
 
 
 def startup():
@@ -90,17 +145,35 @@ def startup():
     print(f"DEBUG MODE == {DEBUGGING}\n")
 
     # Establish cogs
-    bot.add_cog(Dining(bot))
-    bot.add_cog(Hours(bot))
+    with startup_profile.phase("cog construction"):
+        bot.add_cog(Dining(bot))
+        bot.add_cog(Hours(bot))
 
 
 async def main():
     # Start cogs
     for cog in map(bot.get_cog, bot.cogs):
-        await cog.startup()
+        with startup_profile.phase("cog startup"):
+            await cog.startup()
         print()
 
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await serve_metrics(METRICS_PORT)
+        print(f"Serving metrics at http://127.0.0.1:{METRICS_PORT}/metrics")
+
     # Connect
     print("VandyBot is connecting...")
-    await bot.login(TOKEN, bot=True)
-    await bot.connect(reconnect=True)
+    try:
+        with startup_profile.phase("login"):
+            await bot.login(TOKEN, bot=True)
+        await bot.connect(reconnect=True)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await http_client.close()
+
+
+async def shutdown():
+    await bot.close()
+    await http_client.close()
@@ -19,7 +19,7 @@ class AnchorLink(commands.Cog):
 
     def __init__(self, bot):
         self._bot = bot
-        self._session = aiohttp.ClientSession()
+        self._session = http_client
 
         self._category_ids = reader(f"{_dir}/category_ids")
 
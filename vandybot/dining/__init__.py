@@ -1,7 +1,9 @@
-from discord import Embed
+from discord import Embed, HTTPException
 from discord.ext import commands
 
-import vandybot.hours
+import bisect
+import functools
+import sys
 from ..helper import *
 
 _dir = "vandybot/dining"
@@ -57,10 +59,10 @@ class Meal:
     CLOSED = 1
     HOURS_AVAILABLE = 2
 
+    __slots__ = ("slug", "day", "opens", "closes", "hours_status", "items", "items_status", "filtered")
+
     def __init__(self, slug: str, day: Day):
         self.slug = slug
-        self.name = " ".join(map(str.capitalize, slug.split("-")))
-        self.color = self.COLORS.get(self.slug, DEFAULT_COLOR)
         self.day = day
 
         self.opens = Time.MAX
@@ -70,6 +72,9 @@ class Meal:
         self.items = {}
         self.items_status = self.ITEMS_NOT_FOUND
 
+        # mask: filtered items, so old menus keep their own
+        self.filtered = {}
+
     def __lt__(self, other):
         return self.ORDER.index(self.slug) < self.ORDER.index(other.slug)
 
@@ -81,6 +86,14 @@ class Meal:
         else:
             return f"{self.name} on {self.day}"
 
+    @property
+    def color(self):
+        return self.COLORS.get(self.slug, DEFAULT_COLOR)
+
+    @property
+    def name(self):
+        return " ".join(map(str.capitalize, self.slug.split("-")))
+
     @property
     def status(self):
         text = "Unavailable"
@@ -114,10 +127,141 @@ class Meal:
         return text
 
 
+class Item:
+    # Only what rendering and filtering need
+    __slots__ = ("id", "name", "mask")
+
+    def __init__(self, item_id: int, name: str, mask: int):
+        self.id = item_id
+        self.name = name
+        self.mask = mask
+
+
+class Catalog:
+    # Every food NutriSlice lists, stored once by id
+    def __init__(self, reaction_bits: dict):
+        self._items = {}
+        self._reaction_bits = reaction_bits
+
+    def __getitem__(self, item_id):
+        return self._items[item_id]
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def reactions(self):
+        # Bit order, which anything saved has to agree with
+        return list(self._reaction_bits)
+
+    def absorb(self, days: list):
+        # Pick up anything parsed during an earlier refresh
+        for _, items, _ in days:
+            for item_list in items.values():
+                for item in item_list:
+                    self._items.setdefault(item.id, item)
+
+    def intern(self, item: Item):
+        return self._items.setdefault(item.id, item)
+
+
+class Menu(dict):
+    # unit slug: {day: {meal slug: Meal}}, with units only read out of the snapshot when asked for
+    VERSION = 1
+
+    def __init__(self, units=(), catalog: Catalog = None, snapshot: Snapshot = None):
+        super().__init__({unit_slug: {} for unit_slug in units})
+        self.catalog = catalog
+        self.snapshot = snapshot
+        self.timelines = {}
+
+        self.retries = 0
+        self.timestamp = now()
+
+    def __bool__(self):
+        # An unread snapshot still counts
+        return len(self) > 0 or self.snapshot is not None
+
+    def __missing__(self, unit_slug):
+        if self.snapshot is None or f"unit:{unit_slug}" not in self.snapshot:
+            raise KeyError(unit_slug)
+
+        unit_menu = self[unit_slug] = self.decode_unit(self.snapshot[f"unit:{unit_slug}"], self.catalog)
+        return unit_menu
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    @staticmethod
+    def decode_unit(data: dict, catalog: Catalog):
+        items = {item_id: catalog.intern(Item(item_id, name, mask)) for item_id, name, mask in data["items"]}
+        unit_menu = {}
+        for day_index, meals in data["days"].items():
+            day = Day.of(int(day_index))
+            day_menu = unit_menu[day] = {}
+            for meal_slug, (opens, closes, hours_status, items_status, stations) in meals.items():
+                meal = day_menu[meal_slug] = Meal(meal_slug, day)
+                meal.opens, meal.closes = Time.at(*opens), Time.at(*closes)
+                meal.hours_status, meal.items_status = hours_status, items_status
+                meal.items = {sys.intern(station): [items[item_id] for item_id in item_ids]
+                              for station, item_ids in stations}
+
+        return unit_menu
+
+    @staticmethod
+    def encode_unit(unit_menu: dict):
+        items, days = {}, {}
+        for day, day_menu in unit_menu.items():
+            meals = days[int(day)] = {}
+            for meal_slug, meal in day_menu.items():
+                stations = []
+                for station, item_list in meal.items.items():
+                    for item in item_list:
+                        items[item.id] = (item.id, item.name, item.mask)
+                    stations.append((station, [item.id for item in item_list]))
+
+                meals[meal_slug] = ((meal.opens.hour, meal.opens.minute), (meal.closes.hour, meal.closes.minute),
+                                    meal.hours_status, meal.items_status, stations)
+
+        # Foods are only written once per unit
+        return {"items": list(items.values()), "days": days}
+
+    @classmethod
+    def load(cls, filename: str, catalog: Catalog):
+        snapshot = Snapshot(filename)
+        if snapshot.version != cls.VERSION:
+            snapshot.close()
+            raise ValueError(f"{filename} is from an incompatible version.")
+
+        try:
+            meta = snapshot["meta"]
+            if meta.get("reactions") != catalog.reactions:
+                raise ValueError(f"{filename} has different reaction bits.")
+
+            menu = cls(catalog=catalog, snapshot=snapshot)
+            menu.retries = meta["retries"]
+            menu.timestamp = datetime.datetime.fromisoformat(meta["timestamp"])
+        except (AttributeError, KeyError, TypeError, ValueError) as error:
+            snapshot.close()
+            raise ValueError(f"{filename} could not be read: {error}") from None
+
+        return menu
+
+    def save(self, filename: str):
+        sections = {"meta": {"retries": self.retries, "timestamp": self.timestamp.isoformat(),
+                             "reactions": self.catalog.reactions}}
+        sections.update({f"unit:{unit_slug}": self.encode_unit(unit_menu) for unit_slug, unit_menu in self.items()})
+        write_snapshot(filename, self.VERSION, sections)
+
+
 class Stations:
     # This entire class is awful
     DEFAULT = "General Items"
 
+    __slots__ = ("names", "items")
+
     def __init__(self):
         self.names = {None: Stations.DEFAULT}
         self.items = {None: []}
@@ -133,11 +277,41 @@ class Stations:
 
     def __setitem__(self, key, value):
         if key not in self.names.keys():
-            self.names.update({key: value})
+            self.names.update({key: sys.intern(value)})
         else:
             self.items.update({key: value})
 
 
+class Timeline:
+    # A unit's listed meals, in the order find_next_meal checks them
+    __slots__ = ("by_cutoff", "cutoffs", "by_opening")
+
+    def __init__(self, unit_menu: dict, lazy_hours: bool, lazy_map: dict):
+        self.by_cutoff = [[] for _ in week]
+        self.cutoffs = [[] for _ in week]
+        self.by_opening = [[] for _ in week]
+
+        for day, day_menu in unit_menu.items():
+            # Today's meals count until their cutoff; later days just go in order
+            cutoffs = [(lazy_map[meal.slug] if lazy_hours else meal.closes, meal.closes, meal)
+                       for meal in day_menu.values()]
+            cutoffs.sort()
+
+            self.by_cutoff[int(day)] = [meal for *_, meal in cutoffs]
+            self.cutoffs[int(day)] = [cutoff for cutoff, *_ in cutoffs]
+            self.by_opening[int(day)] = sorted(day_menu.values(), key=lambda meal: (meal.opens, meal))
+
+    def walk(self, start: Day, time: datetime.time):
+        day, current = int(start), int(today())
+        if day == current:
+            yield from self.by_cutoff[day][bisect.bisect_right(self.cutoffs[day], time):]
+            day = (day + 1) % 7
+
+        while day != current:
+            yield from self.by_opening[day]
+            day = (day + 1) % 7
+
+
 # Main Cog
 class Dining(commands.Cog):
     # URL stuff
@@ -147,7 +321,25 @@ class Dining(commands.Cog):
     SCHEDULE = [Time("4:20 AM")]
     RETRY_DELAY = 600
     MAX_RETRIES = 3
-    CACHE_SIZE = 32
+    MAX_CONCURRENCY = 8
+
+    # Serve the last snapshot while the first refresh runs
+    STALE_STARTUP = True
+
+    # Bump whenever parse_week changes shape
+    PARSE_VERSION = 2
+    # Only a backstop; messages normally age out after CACHE_TTL
+    CACHE_SIZE = 4096
+    CACHE_TTL = 21600
+    CACHE_PRUNE_DELAY = 300
+    EDIT_DELAY = 0.75
+    FOOD_TRUCK_TTL = 3600
+
+    # How many of the last refresh's slowest requests get reported
+    SLOWEST_REPORTED = 5
+
+    # Argument types, in order of preference
+    ARG_KINDS = ("unit", "food truck", "menu keyword", "meal", "relative day", "day")
 
     MIN_MENU_AGE = 80000
     MIN_SINCE = 3600
@@ -160,41 +352,68 @@ class Dining(commands.Cog):
 
     def __init__(self, bot):
         self._bot = bot
-        self._session = aiohttp.ClientSession()
+        self._session = http_client
 
         self._unit_slugs = reader(f"{_dir}/units")
         self._unit_set = set(self._unit_slugs.values())
         self._unit_conditions = reader(f"{_dir}/unit_conditions")
 
         self._food_trucks = reader(f"{_dir}/food_trucks")
+        self._food_truck_index = ReadThroughCache(self.get_food_truck_index, self.FOOD_TRUCK_TTL)
         self._meal_slugs = reader(f"{_dir}/meals")
+
+        # Shared with Hours
+        resolver.add("unit", self._unit_slugs)
+        resolver.add("food truck", self._food_trucks)
+        resolver.add("meal", self._meal_slugs)
+        resolver.add("menu keyword", {"next": "next", "list": "list"})
         self._meal_set = set(self._meal_slugs.values())
 
         self._list = reader(f"{_dir}/list")
 
-        self._cache = {}
+        self._cache = LRUCache(self.CACHE_SIZE, self.CACHE_TTL, on_evict=self.queue_cleanup)
+        self._cleanup = asyncio.Queue()
+        self._edits = Debouncer(self.EDIT_DELAY)
         self._reactions = reader(f"{_dir}/reactions/list")
 
-        self._menu = {}
+        # One bit per reaction, in list order
+        self._reaction_bits = {name: 1 << index for index, name in enumerate(self._reactions)}
+        self._free_mask = sum(bit for name, bit in self._reaction_bits.items() if name.endswith("_free"))
+        self._catalog = Catalog(self._reaction_bits)
+
+        self._menu = Menu()
         self._retries = 0
         self._timestamp = now()
-
-    @staticmethod
-    def filter_items(items: dict, restrictions: set):
+        self._refreshing = False
+        self._stale = False
+        self._timings = {}
+        self._validators = Validators(f"{_dir}/validators.json", version=self.parse_version,
+                                      encode=self.encode_week, decode=self.decode_week)
+
+        metrics.track_cache("menu messages", self._cache)
+        metrics.track_cache("food trucks", self._food_truck_index)
+        metrics.collect(lambda: [("vandybot_menu_age_seconds", "gauge", {}, (now() - self._timestamp).total_seconds()),
+                                 ("vandybot_menu_retries", "gauge", {}, self._retries)])
+        metrics.collect(self.refresh_timings)
+
+    def filter_items(self, unit_slug: str, meal: Meal, restrictions: set):
         if not restrictions:
-            return items
+            return meal.items
 
-        # This is gross but Vegan ⊂ Vegetarian
-        subsets = {"vegetarian": ("vegetarian", "vegan")}
-        restrictions = [subsets.get(restriction, (restriction,)) for restriction in restrictions]
+        mask = self.restriction_mask(restrictions)
+        try:
+            return meal.filtered[mask]
+        except KeyError:
+            pass
 
-        # Evil fixed point bit level hacking
-        return {station: [item for item in item_list
-                          if all(any((alternative.split("_")[0].capitalize() in map(lambda i: i["synced_name"],
-                                                                                    item["icons"]["food_icons"]))
-                                     ^ (alternative[-5:] == "_free") for alternative in restriction)
-                                 for restriction in restrictions)]
-                for station, item_list in items.items()}
+        # Diets need their bit set, allergens need theirs clear
+        required, forbidden = mask & ~self._free_mask, mask & self._free_mask
+        filtered = {station: [item for item in item_list
+                              if item.mask & required == required and not item.mask & forbidden]
+                    for station, item_list in meal.items.items()}
+
+        meal.filtered[mask] = filtered
+        return filtered
 
     @staticmethod
     def generate_embed(title, url, color, fields, inline=False, max_len=240):
@@ -211,202 +430,367 @@ class Dining(commands.Cog):
     def cached(self, message_id: int):
         return message_id in self._cache
 
-    def find_next_meal(self, unit_slug: str, start: Day, meal_slug: str = None, relaxed=False):
-        permitted = [Meal.ITEMS_AVAILABLE]
-        if relaxed:
-            # Second pass in case NutriSlice is truly delirious
-            permitted.append(Meal.ITEMS_NOT_LISTED)
-
-        # Fake shallow copy
-        day = copy.copy(start)
-        if day.is_today:
-            options = list(self._menu[unit_slug][day].values()) \
-                if meal_slug is None else [self._menu[unit_slug][day][meal_slug]]
-            next_meal = first(meal for meal in sorted(options, key=lambda meal: (meal.closes, meal))
-                              if meal.items_status in permitted and (
-                                  self.LAZY_MAP[meal.slug] if self.LAZY_HOURS else meal.closes) > now().time())
-            if next_meal is not None:
-                return next_meal
-            day += 1
-
-        while not day.is_today:
-            options = list(self._menu[unit_slug][day].values()) \
-                if meal_slug is None else [self._menu[unit_slug][day][meal_slug]]
-            next_meal = first(meal for meal in sorted(options, key=lambda meal: (meal.opens, meal))
-                              if meal.items_status in permitted)
-            if next_meal is not None:
-                return next_meal
-            day += 1
-
-        if not relaxed:
-            return self.find_next_meal(unit_slug, start, meal_slug=meal_slug, relaxed=True)
+    async def cleanup_reactions(self):
+        # Evicted messages lose their reactions, whenever nothing else needs the channel
+        while True:
+            message = await self._cleanup.get()
+            for reaction in self._reactions.values():
+                try:
+                    await outbox.remove(message, reaction, self._bot.user)
+                except HTTPException:
+                    # Probably deleted
+                    break
+
+    def find_next_meal(self, unit_slug: str, start: Day, meal_slug: str = None):
+        relaxed = None
+        for meal in self.get_timeline(unit_slug).walk(start, now().time()):
+            if meal_slug is None or meal.slug == meal_slug:
+                if meal.items_status == Meal.ITEMS_AVAILABLE:
+                    return meal
+                elif relaxed is None:
+                    # Fallback in case NutriSlice is truly delirious
+                    relaxed = meal
+
+        if relaxed is not None:
+            return relaxed
 
         # No one's around to help
         raise MenuNotFound(unit_slug) from None
 
-    async def get_food_truck_menu(self, unit_slug: str):
+    async def get_food_truck_index(self, _=None):
         response = await fetch(self._session, self.FOOD_TRUCK_URL)
-        soup = BeautifulSoup(response, "html.parser")
-        food_trucks = {food_truck.get_text(): food_truck.find("a") for food_truck in soup.find_all("h4")}
+        page = soup(response)
+
+        # Name: menu image
+        return {food_truck.get_text(): food_truck.find("a")["href"] if food_truck.find("a") is not None else None
+                for food_truck in page.find_all("h4")}
+
+    async def get_food_truck_menu(self, unit_slug: str):
+        food_trucks = await self._food_truck_index.get()
 
         # Food trucks are special
         try:
             menu = food_trucks[unit_slug]
             if menu is None:
                 raise MenuNotAvailable(unit_slug) from None
-            return menu["href"]
+            return menu
         except KeyError:
             raise UnitNotFound(unit_slug) from None
 
+    def get_timeline(self, unit_slug: str):
+        try:
+            return self._menu.timelines[unit_slug]
+        except KeyError:
+            # Snapshots build theirs as units get loaded
+            timeline = self._menu.timelines[unit_slug] = Timeline(self._menu[unit_slug], self.LAZY_HOURS,
+                                                                  self.LAZY_MAP)
+            return timeline
+
+    def get_meal(self, unit_slug: str, day: Day, meal_slug: str):
+        try:
+            return self._menu[unit_slug][day][meal_slug]
+        except KeyError:
+            # Nothing was ever listed
+            return Meal(meal_slug, day)
+
     @staticmethod
     def get_item_name(item: dict):
         return item["name"].replace(" - Placeholder", "").replace(" - placeholder", "")
 
+    async def get_hours_table(self, unit_slugs: list, timings: dict):
+        # Every unit's weekly hours in one go, which also warms up ~hours
+        start = perf_counter()
+        table = await self._bot.get_cog("Hours").prefetch_dining_hours([unit_name(slug) for slug in unit_slugs])
+        timings["hours"] = perf_counter() - start
+        return {slug: table[unit_name(slug)] for slug in unit_slugs if unit_name(slug) in table}
+
+    @profiler.profiled("refresh")
     async def get_menu(self):
-        # Create blank menu
-        menu = {unit_slug:
-                    {day:
-                         {meal_slug: Meal(meal_slug, day)
-                          for meal_slug in self._meal_set}
-                     for day in week}
-                for unit_slug in self._unit_set}
+        self._refreshing = True
+
+        # Meals only get created once there's something to put in them
+        catalog = Catalog(self._reaction_bits)
+        menu = Menu(self._unit_set, catalog)
+        memory = rss()
+
+        # Everything goes through the same limiter
+        limiter = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        timings = {}
+        start = perf_counter()
+        self._validators.reset()
 
         # Go through the units
         try:
-            for unit in await jfetch(self._session, f"{self.MENU_URL}/menu/api/schools"):
-                unit_slug = unit["slug"]
-                if unit_slug not in self._unit_set:
-                    print(f"Missing unit option: {unit_slug}")
+            units = []
+            for unit in await self.menu_fetch("/menu/api/schools", limiter, timings):
+                if unit["slug"] not in self._unit_set:
+                    print(f"Missing unit option: {unit['slug']}")
                     continue
 
-                unit_menu = menu[unit_slug]
-                try:
-                    unit_hours = await self._bot.get_cog("Hours").get_dining_hours_dispatch(unit_slug)
-                except vandybot.hours.UnitNotFound:
-                    unit_hours = {}
-
-                # Find available meals
-                for meal in unit["active_menu_types"]:
-                    meal_slug = meal["slug"]
-                    if meal_slug not in self._meal_set:
-                        print(f"Missing meal option: {meal_slug}")
-
-                    year, month, day, *_ = datetime.date.today().timetuple()
-                    url = f"/menu/api/weeks/school/{unit_slug}/menu-type/{meal_slug}/{year}/{month}/{day}/"
-                    next_url = f"/menu/api/weeks/school/{unit_slug}/menu-type/{meal_slug}/{year}/{month}/{day + 7}/"
-                    in_week = False
-
-                    # Find available dates
-                    for listing in (await jfetch(self._session, f"{self.MENU_URL}{url}"))["days"] + \
-                                   (await jfetch(self._session, f"{self.MENU_URL}{next_url}"))["days"]:
-                        day = Day(datetime.date.fromisoformat(listing["date"]).strftime("%A"))
-                        if day.is_today:
-                            in_week = not in_week
-
-                        if in_week:
-                            stations = Stations()
-
-                            for item in listing["menu_items"]:
-                                station_id = item["station_id"]
-                                if item["is_station_header"]:
-                                    stations[station_id] = item["text"]
-                                else:
-                                    stations[station_id] += [item["food"]]
-
-                            current = unit_menu[day][meal_slug]
-                            current.items = dict(stations)
-                            if current.items:
-                                current.items_status = Meal.ITEMS_AVAILABLE
-                            elif listing["has_unpublished_menus"]:
-                                current.items_status = Meal.ITEMS_NOT_LISTED
-                            else:
-                                current.items_status = Meal.ITEMS_NOT_FOUND
-
-                # Match the times from NetNutrition
-                if unit_hours:
-                    for day in week:
-                        need_hours = sorted([meal for meal in unit_menu[day].values() if
-                                             meal.items_status != Meal.ITEMS_NOT_FOUND and
-                                             meal.slug != Meal.DEFAULT])
-                        need_hours = need_hours if need_hours else [unit_menu[day][Meal.DEFAULT]]
-
-                        hour_index = 0
-                        hour_max = len(unit_hours[day])
-                        for current in need_hours:
-                            if len(need_hours) <= hour_max or \
-                                    len(need_hours) > hour_max and current.items_status == Meal.ITEMS_AVAILABLE:
-                                # There are enough hours to go around
-                                try:
-                                    current.opens, current.closes = unit_hours[day][hour_index]
-                                    current.hours_status = Meal.HOURS_AVAILABLE
-                                    hour_index += len(set(unit_hours[day])) != 1
-                                except ValueError:
-                                    # Is a closed
-                                    current.hours_status = Meal.CLOSED
-
-                            if hour_index >= hour_max:
-                                break
-
-                        # Set Daily Offerings hours
-                        if need_hours:
-                            default = unit_menu[day][Meal.DEFAULT]
-                            default.opens = min(meal.opens for meal in need_hours)
-                            default.closes = max(meal.closes for meal in need_hours)
-                            default.hours_status = Meal.HOURS_AVAILABLE
-
-        except aiohttp.ClientConnectionError:
+                units.append(unit)
+
+            # Hours come in alongside the menus
+            hours_table = asyncio.ensure_future(self.get_hours_table([unit["slug"] for unit in units], timings))
+            await asyncio.gather(*(self.get_unit_menu(unit, menu[unit["slug"]], catalog, hours_table, limiter, timings)
+                                   for unit in units))
+
+        except (aiohttp.ClientError, asyncio.TimeoutError):
             # Need to restart the fetch
             print("VandyBot could not access the NutriSlice API server.")
             await self.retry()
             return
 
+        # Build the lookups while we're here
+        menu.timelines = {unit_slug: Timeline(unit_menu, self.LAZY_HOURS, self.LAZY_MAP)
+                          for unit_slug, unit_menu in menu.items()}
+
+        elapsed = perf_counter() - start
+        metrics.observe("vandybot_refresh_seconds", elapsed)
+        slowest = max(timings, key=timings.get)
+        print(f"Fetched {len(timings)} menu resources in {elapsed:.2f}s "
+              f"({sum(timings.values()):.2f}s of requests, slowest was {slowest} at {timings[slowest]:.2f}s)")
+        self._timings = timings
+        print(f"Menu endpoints: {self._validators}; {len(catalog)} unique foods")
+
         # Success check
         if not self._menu or menu:
+            self._menu.close()
             self._menu = menu
+            self._catalog = catalog
             self._timestamp = now()
+            self._refreshing = self._stale = False
 
-            self._menu["Retries"] = self._retries
-            self._menu["Timestamp"] = self._timestamp
+            self._menu.retries = self._retries
+            self._menu.timestamp = self._timestamp
             self._retries = 0
+            print(f"Resident memory went from {memory / 2 ** 20:.1f} MB to {rss() / 2 ** 20:.1f} MB")
 
             # Save new menu
-            with open(f"{_dir}/menu.pickle", "wb") as menu_pickle:
-                pickle.dump(self._menu, menu_pickle)
-
-            # Cache pruning
-            cache = list(self._cache.items())
-            while len(cache) > self.CACHE_SIZE:
-                oldest_message = cache[0][1][0]
-                for reaction in self._reactions.values():
-                    await oldest_message.remove_reaction(reaction, self._bot.user)
-                cache.pop(0)
-            self._cache = dict(cache)
+            self._menu.save(f"{_dir}/menu.snapshot")
+            self._validators.save()
+
+            print(f"Reaction cache holds {len(self._cache)} messages: {self._cache.stats}")
+            print(f"Coalesced {self._edits.saved} of {self._edits.stats['requested']} menu edits")
+            print(f"HTTP pool: {http_client}")
+            print(f"Upstream requests: {single_flight}")
+            print(f"Discord calls: {outbox}")
 
             # Schedule the next fetch
             self._bot.loop.create_task(schedule(self.get_menu, self.SCHEDULE))
         else:
             await self.retry()
 
+    async def get_unit_menu(self, unit: dict, unit_menu: dict, catalog: Catalog, hours_table: asyncio.Future,
+                            limiter: asyncio.Semaphore, timings: dict):
+        unit_slug = unit["slug"]
+
+        # Find available meals
+        meal_slugs = []
+        for meal in unit["active_menu_types"]:
+            meal_slug = meal["slug"]
+            if meal_slug not in self._meal_set:
+                print(f"Missing meal option: {meal_slug}")
+                continue
+
+            meal_slugs.append(meal_slug)
+
+        # Weeks are requested from their Sunday so the URLs (and their validators) hold for the whole week
+        sunday = datetime.date.today() - datetime.timedelta(days=int(today()))
+        urls = [f"/menu/api/weeks/school/{unit_slug}/menu-type/{meal_slug}/{date.year}/{date.month}/{date.day}/"
+                for meal_slug in meal_slugs for date in (sunday, sunday + datetime.timedelta(days=7))]
+
+        # Fire off everything for this unit at once
+        weeks = await asyncio.gather(*(self.week_fetch(url, catalog, limiter, timings) for url in urls))
+
+        for index, meal_slug in enumerate(meal_slugs):
+            in_week = False
+
+            # Find available dates
+            for date, items, unpublished in weeks[2 * index] + weeks[2 * index + 1]:
+                day = Day.of(date.isoweekday())
+                if day.is_today:
+                    in_week = not in_week
+
+                if in_week and (items or unpublished):
+                    current = unit_menu.setdefault(day, {})[meal_slug] = Meal(meal_slug, day)
+                    current.items = items
+                    current.items_status = Meal.ITEMS_AVAILABLE if items else Meal.ITEMS_NOT_LISTED
+
+        # Match the times from NetNutrition
+        unit_hours = (await hours_table).get(unit_slug)
+        if unit_hours:
+            self.match_hours(unit_menu, unit_hours)
+
+    @staticmethod
+    def match_hours(unit_menu: dict, unit_hours: dict):
+        for day, day_menu in unit_menu.items():
+            need_hours = sorted([meal for meal in day_menu.values() if
+                                 meal.items_status != Meal.ITEMS_NOT_FOUND and
+                                 meal.slug != Meal.DEFAULT])
+            if not need_hours:
+                need_hours = [day_menu[Meal.DEFAULT]] if Meal.DEFAULT in day_menu else []
+
+            hour_index = 0
+            hour_max = len(unit_hours[day])
+            for current in need_hours:
+                if len(need_hours) <= hour_max or \
+                        len(need_hours) > hour_max and current.items_status == Meal.ITEMS_AVAILABLE:
+                    # There are enough hours to go around
+                    try:
+                        current.opens, current.closes = unit_hours[day][hour_index]
+                        current.hours_status = Meal.HOURS_AVAILABLE
+                        hour_index += len(set(unit_hours[day])) != 1
+                    except ValueError:
+                        # Is a closed
+                        current.hours_status = Meal.CLOSED
+
+                if hour_index >= hour_max:
+                    break
+
+            # Set Daily Offerings hours
+            if need_hours and Meal.DEFAULT in day_menu:
+                default = day_menu[Meal.DEFAULT]
+                default.opens = min(meal.opens for meal in need_hours)
+                default.closes = max(meal.closes for meal in need_hours)
+                default.hours_status = Meal.HOURS_AVAILABLE
+
+    async def menu_fetch(self, url: str, limiter: asyncio.Semaphore, timings: dict):
+        async with limiter:
+            start = perf_counter()
+            try:
+                return await jfetch(self._session, f"{self.MENU_URL}{url}")
+            finally:
+                timings[url] = perf_counter() - start
+
+    def icon_mask(self, food: dict):
+        icons = {icon["synced_name"] for icon in food["icons"]["food_icons"]}
+        mask = 0
+        for name, bit in self._reaction_bits.items():
+            if name.split("_")[0].capitalize() in icons:
+                mask |= bit
+
+        # This is gross but Vegan ⊂ Vegetarian
+        if mask & self._reaction_bits["vegan"]:
+            mask |= self._reaction_bits["vegetarian"]
+
+        return mask
+
+    def decode_week(self, data: list):
+        # Validators hold plain data; foods go back through the catalog
+        return [(datetime.date.fromisoformat(date),
+                 {sys.intern(station): [self._catalog.intern(Item(item_id, name, mask))
+                                        for item_id, name, mask in item_list] for station, item_list in stations},
+                 unpublished) for date, stations, unpublished in data]
+
+    @staticmethod
+    def encode_week(days: list):
+        return [(date.isoformat(), [(station, [(item.id, item.name, item.mask) for item in item_list])
+                                    for station, item_list in items.items()], unpublished)
+                for date, items, unpublished in days]
+
+    @property
+    def parse_version(self):
+        # Parsed items carry reaction bits, so reordering the reaction list counts as a change too
+        return [self.PARSE_VERSION, list(self._reactions)]
+
+    def parse_week(self, week: dict, catalog: Catalog):
+        days = []
+        for listing in week["days"]:
+            stations = Stations()
+
+            for item in listing["menu_items"]:
+                station_id = item["station_id"]
+                if item["is_station_header"]:
+                    stations[station_id] = item["text"]
+                else:
+                    food = item["food"]
+                    try:
+                        stations[station_id] += [catalog[food["id"]]]
+                    except KeyError:
+                        # First sighting this refresh
+                        stations[station_id] += [catalog.intern(Item(food["id"], self.get_item_name(food),
+                                                                     self.icon_mask(food)))]
+
+            days.append((datetime.date.fromisoformat(listing["date"]), dict(stations),
+                         listing["has_unpublished_menus"]))
+
+        return days
+
+    async def prune_cache(self):
+        while True:
+            await asyncio.sleep(self.CACHE_PRUNE_DELAY)
+            self._cache.prune()
+
+    def queue_cleanup(self, message_id: int, entry: tuple):
+        self._cleanup.put_nowait(entry[0])
+
+    async def refresh_food_trucks(self):
+        try:
+            await self._food_truck_index.refresh()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            print("VandyBot could not access the food truck menus.")
+
+        self._bot.loop.create_task(schedule(self.refresh_food_trucks, self.SCHEDULE))
+
+    def refresh_timings(self):
+        # The last refresh's slowest requests, for the metrics
+        slowest = sorted(self._timings.items(), key=lambda timing: timing[1], reverse=True)
+        return [("vandybot_refresh_request_seconds", "gauge", {"resource": resource}, seconds)
+                for resource, seconds in slowest[:self.SLOWEST_REPORTED]]
+
+    def restriction_mask(self, restrictions: set):
+        return sum(self._reaction_bits[restriction] for restriction in restrictions)
+
     async def retry(self):
         # Fetch failed for some reason
         if self._retries < self.MAX_RETRIES or not self._menu:
             # Can keep trying
             print(f"Trying again in {self.RETRY_DELAY} seconds...")
+            metrics.count("vandybot_refresh_retries_total")
             await asyncio.sleep(self.RETRY_DELAY)
             self._retries += 1
             await self.get_menu()
         elif self._retries >= self.MAX_RETRIES:
             # Give up, use the old one
-            with open(f"{_dir}/menu.pickle") as menu_pickle:
-                self._menu = pickle.load(menu_pickle)
+            try:
+                menu = Menu.load(f"{_dir}/menu.snapshot", self._catalog)
+            except (OSError, ValueError):
+                print("Retries failed. Keeping the current menu.")
+            else:
+                self._menu.close()
+                self._menu = menu
+                self._timestamp = self._menu.timestamp
+                self._stale = True
+                print(f"Retries failed. Using cached menu from {self._timestamp}.")
 
+            self._refreshing = False
             self._retries = 0
-            self._timestamp = self._menu["Timestamp"]
-            print(f"Retries failed. Using cached menu from {self._timestamp}.")
+
+            # Still try again tomorrow
+            self._bot.loop.create_task(schedule(self.get_menu, self.SCHEDULE))
 
     async def startup(self):
         print("Starting the Dining cog...")
-        await self.get_menu()
+        self._bot.loop.create_task(self.cleanup_reactions())
+        self._bot.loop.create_task(self.prune_cache())
+        self._bot.loop.create_task(schedule(self.refresh_food_trucks, self.SCHEDULE))
+
+        if not self.STALE_STARTUP:
+            await self.get_menu()
+            return
+
+        try:
+            with startup_profile.phase("snapshot load"):
+                self._menu = Menu.load(f"{_dir}/menu.snapshot", self._catalog)
+            self._timestamp = self._menu.timestamp
+            self._stale = True
+            print(f"Serving the cached menu from {self._timestamp} until the refresh finishes.")
+        except (OSError, ValueError):
+            print("No cached menu to serve. Menus are unavailable until the refresh finishes.")
+
+        # Don't hold up the connection
+        self._refreshing = True
+        self._bot.loop.create_task(self.get_menu())
 
     @commands.command(name="menu",
                       brief="Gets menus from on-campus dining locations",
@@ -425,7 +809,7 @@ class Dining(commands.Cog):
             if unit_slug == "list":
                 # Largest listing
                 embed = self.menu_list()
-                await ctx.send(embed=embed)
+                await outbox.send(ctx, embed=embed)
                 continue
             elif unit_slug in self._food_trucks.values():
                 # Food trucks are special
@@ -433,13 +817,16 @@ class Dining(commands.Cog):
                 embed = Embed(title=unit_slug, url=self.FOOD_TRUCK_URL, color=0x7ED321)
                 embed.set_image(url=menu_img)
                 embed.set_footer(text="Food trucks are available on campus on a rotating schedule")
-                await ctx.send(embed=embed)
+                await outbox.send(ctx, embed=embed)
                 continue
+            elif not self._menu:
+                # Still waiting on the first refresh
+                raise MenuNotAvailable(unit_slug)
 
             for day in days:
                 if day == "list":
                     embed = self.menu_list(unit_slug)
-                    await ctx.send(embed=embed)
+                    await outbox.send(ctx, embed=embed)
                     continue
 
                 for meal_slug in meal_slugs:
@@ -447,18 +834,18 @@ class Dining(commands.Cog):
 
                     if meal_slug == "next":
                         if all(meal.hours_status == Meal.HOURS_NOT_FOUND
-                               for meal in self._menu[unit_slug][day].values()) and not self.LAZY_HOURS:
+                               for meal in self._menu[unit_slug].get(day, {}).values()) and not self.LAZY_HOURS:
                             meal_slug = "list"
                         else:
                             meal = self.find_next_meal(unit_slug, day)
 
                     if meal_slug == "list":
                         embed = self.menu_list(unit_slug, day)
-                        await ctx.send(embed=embed)
+                        await outbox.send(ctx, embed=embed)
                         continue
 
                     if meal is None:
-                        meal = self._menu[unit_slug][day][meal_slug]
+                        meal = self.get_meal(unit_slug, day, meal_slug)
 
                     closing = time_on(datetime.date.today(), meal.closes)
                     if meal.items_status == Meal.ITEMS_NOT_FOUND or \
@@ -468,20 +855,19 @@ class Dining(commands.Cog):
 
                     restrictions = set()
                     embed = self.menu_dispatch(unit_slug, meal, restrictions)
-                    message = await ctx.send(embed=embed)
+                    message = await outbox.send(ctx, embed=embed)
 
+                    # The rest of the replies go out first
                     for reaction in self._reactions.values():
-                        await message.add_reaction(reaction)
-
-                    self._cache.update({message.id: (message, unit_slug, meal, restrictions)})
+                        outbox.decorate(message, reaction)
 
-            await asyncio.sleep(1)
+                    self._cache[message.id] = (message, unit_slug, meal, restrictions)
 
     def menu_dispatch(self, unit_slug: str, meal: Meal, restrictions: set):
         if meal.items_status == Meal.ITEMS_NOT_LISTED:
             items = {"No Items Listed": "Please try again later."}
         else:
-            items = self.filter_items(meal.items, restrictions)
+            items = self.filter_items(unit_slug, meal, restrictions)
 
         if restrictions:
             subtitle = joiner(list(map(lambda r: "-".join(map(str.capitalize,
@@ -492,7 +878,7 @@ class Dining(commands.Cog):
 
         fields = {underline(subtitle + str(meal)): meal.status}
         for station, item_list in items.items():
-            options = joiner(list(map(self.get_item_name, item_list)))
+            options = joiner([item.name for item in item_list])
             if options:
                 fields[station] = options
 
@@ -502,6 +888,12 @@ class Dining(commands.Cog):
 
         return embed
 
+    async def menu_edit(self, message, unit_slug: str, meal: Meal, restrictions: set):
+        # Restrictions are whatever they ended up as once the burst died down
+        with clock():
+            embed = self.menu_dispatch(unit_slug, meal, restrictions)
+        await outbox.edit(message, embed=embed)
+
     def menu_footer(self, unit_slug: str):
         condition = self._unit_conditions.get(unit_slug, "")
         if "Closed due to" == condition[:13]:
@@ -509,7 +901,11 @@ class Dining(commands.Cog):
         elif condition:
             return condition
         else:
-            return self._timestamp.strftime("Last updated on %b %d at %I:%M %p")
+            footer = self._timestamp.strftime("Last updated on %b %d at %I:%M %p")
+            if self._stale:
+                footer += f" ({age(self._timestamp)} old{', refreshing now' if self._refreshing else ''})"
+
+            return footer
 
     def menu_list(self, unit_slug: str = None, day: Day = None):
         if unit_slug is None and day is None:
@@ -540,7 +936,7 @@ class Dining(commands.Cog):
         else:
             # The day's listing
             fields = {str(meal): ", ".join(item for item in meal.items.keys())
-                      for meal in sorted(self._menu[unit_slug][day].values())
+                      for meal in sorted(self._menu[unit_slug].get(day, {}).values())
                       if meal.items_status == Meal.ITEMS_AVAILABLE}
             if not fields:
                 raise MenuNotFound(unit_slug)
@@ -557,43 +953,20 @@ class Dining(commands.Cog):
 
         # Args can be in any order
         for arg in args:
-            arg = reduce(arg, "dining")
-            try:
-                # Is a unit?
-                unit_slugs.update({self._unit_slugs[arg]: 0})
-                continue
-            except KeyError:
-                pass
-
-            try:
-                # Is a food truck?
-                unit_slugs.update({self._food_trucks[arg]: 0})
-                continue
-            except KeyError:
-                pass
-
-            try:
-                # Is a meal or a listing request?
-                if arg == "next":
-                    meal_slugs = {arg: 0}
-                elif arg == "list":
-                    listing = True
+            kind, value = resolver.resolve(reduce(arg, "dining"), self.ARG_KINDS)
+            if kind in ("unit", "food truck"):
+                unit_slugs.update({value: 0})
+            elif kind == "menu keyword":
+                if value == "next":
+                    meal_slugs = {value: 0}
                 else:
-                    meal_slugs.update({self._meal_slugs[arg]: 0})
-                continue
-            except KeyError:
-                pass
-
-            # Is a day?
-            if arg == "today":
-                days.update({today(): 0})
-            elif arg == "tomorrow":
-                days.update({tomorrow(): 0})
+                    listing = True
+            elif kind == "meal":
+                meal_slugs.update({value: 0})
+            elif kind == "relative day":
+                days.update({value(): 0})
             else:
-                try:
-                    days.update({Day(arg): 0})
-                except ValueError:
-                    raise commands.BadArgument(f"Invalid argument provided: {arg}") from None
+                days.update({value: 0})
 
         if not listing:
             if not unit_slugs:
@@ -618,21 +991,44 @@ class Dining(commands.Cog):
 
         return unit_slugs, days, meal_slugs
 
+    async def week_fetch(self, url: str, catalog: Catalog, limiter: asyncio.Semaphore, timings: dict):
+        async with limiter:
+            start = perf_counter()
+            try:
+                days = await cfetch(self._session, f"{self.MENU_URL}{url}", self._validators,
+                                    parser=lambda week: self.parse_week(week, catalog))
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if f"{self.MENU_URL}{url}" not in self._validators:
+                    raise
+
+                days = self._validators.failed(f"{self.MENU_URL}{url}")
+            finally:
+                timings[url] = perf_counter() - start
+
+        catalog.absorb(days)
+        return days
+
     async def on_raw_reaction_add(self, payload):
         if payload.emoji.name in self._reactions:
-            message, unit_slug, meal, restrictions = self._cache[payload.message_id]
-            restrictions.add(payload.emoji.name)
+            try:
+                message, unit_slug, meal, restrictions = self._cache[payload.message_id]
+            except KeyError:
+                # Expired in the meantime
+                return
 
-            embed = self.menu_dispatch(unit_slug, meal, restrictions)
-            await message.edit(embed=embed)
+            restrictions.add(payload.emoji.name)
+            self._edits(payload.message_id, functools.partial(self.menu_edit, message, unit_slug, meal, restrictions))
 
     async def on_raw_reaction_remove(self, payload):
         if payload.emoji.name in self._reactions:
-            message, unit_slug, meal, restrictions = self._cache[payload.message_id]
+            try:
+                message, unit_slug, meal, restrictions = self._cache[payload.message_id]
+            except KeyError:
+                return
+
             try:
                 restrictions.remove(payload.emoji.name)
             except KeyError:
                 pass
 
-            embed = self.menu_dispatch(unit_slug, meal, restrictions)
-            await message.edit(embed=embed)
+            self._edits(payload.message_id, functools.partial(self.menu_edit, message, unit_slug, meal, restrictions))
@@ -1,11 +1,24 @@
 import aiohttp
 import asyncio
-import copy
+import bisect
+import collections
+import contextlib
+import contextvars
 import datetime
-import pickle
+import functools
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import urllib.parse
+from time import monotonic, perf_counter
 
-from bs4 import BeautifulSoup
 from discord import Activity, ActivityType
+from discord.ext.commands import BadArgument
 
 # A nice grey
 DEFAULT_COLOR = 0x9B9B9B
@@ -18,6 +31,15 @@ GITHUB_URL = "https://github.com/kg583/VandyBot"
 # Max returns in a single command
 MAX_RETURNS = 5
 
+# Concurrent requests allowed per host; anything unlisted gets HTTPClient.limit_per_host
+HOST_LIMITS = {"netnutrition.cbord.com": 4}
+
+# Snapshot files start with this
+SNAPSHOT_MAGIC = b"VBSN"
+
+# Label values can't have these raw
+PROMETHEUS_ESCAPES = str.maketrans({"\\": "\\\\", "\"": "\\\"", "\n": "\\n"})
+
 # Replace common separators with '-'
 SEPS = str.maketrans({
                          " ": "-",
@@ -46,12 +68,47 @@ def code(string):
     return f"`{string}`"
 
 
-async def fetch(session, url, params=None):
-    async with session.get(url, params=params) as response:
-        if response.status != 200:
+def age(timestamp):
+    seconds = int((now() - timestamp).total_seconds())
+    for name, length in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= length:
+            count = seconds // length
+            return f"{count} {name}{'s' if count != 1 else ''}"
+
+    return "under a minute"
+
+
+async def cfetch(session, url, validators, parser=None, params=None):
+    # Conditional GET; hands back whatever was parsed last time if nothing changed
+    async with session.get(url, params=params, headers=validators.headers(url)) as response:
+        if response.status == 304:
+            return validators.unchanged(url)
+        elif response.status != 200:
             raise aiohttp.ClientConnectionError(f"Could not fetch from {url}.") from None
-        text = await response.text()
-        return text.encode().decode("unicode-escape")
+
+        body = await response.read()
+        etag, modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+    digest = hashlib.sha1(body).hexdigest()
+    if digest == validators.digest(url):
+        return validators.unchanged(url, etag, modified)
+
+    value = json.loads(body)
+    if parser is not None:
+        value = parser(value)
+
+    return validators.changed(url, etag, modified, digest, value)
+
+
+async def fetch(session, url, params=None):
+    async def request():
+        async with session.get(url, params=params) as response:
+            if response.status != 200:
+                raise aiohttp.ClientConnectionError(f"Could not fetch from {url}.") from None
+            text = await response.text()
+            return text.encode().decode("unicode-escape")
+
+    return await single_flight("GET", url, params, None, request)
 
 
 def find_oid(element):
@@ -72,10 +129,14 @@ def hours_reader(filename):
 
 
 async def jfetch(session, url, params=None):
-    async with session.get(url, params=params) as response:
-        if response.status != 200:
-            raise aiohttp.ClientConnectionError(f"Could not fetch from {url}.") from None
-        return await response.json()
+    async def request():
+        async with session.get(url, params=params) as response:
+            if response.status != 200:
+                raise aiohttp.ClientConnectionError(f"Could not fetch from {url}.") from None
+            return await response.json()
+
+    # Coalesced callers get the same object, so look but don't touch
+    return await single_flight("GET json", url, params, None, request)
 
 
 def joiner(words):
@@ -89,6 +150,37 @@ def joiner(words):
         return ""
 
 
+def levenshtein(first, second):
+    # Bit-parallel (Myers/Hyyrö), since the BK-tree calls this a lot
+    if not first or not second:
+        return len(first) + len(second)
+
+    matches = {}
+    for index, char in enumerate(first):
+        matches[char] = matches.get(char, 0) | 1 << index
+
+    full = (1 << len(first)) - 1
+    last = 1 << len(first) - 1
+    plus, minus, distance = full, 0, len(first)
+    for char in second:
+        eq = matches.get(char, 0)
+        vertical = eq | minus
+        horizontal = ((eq & plus) + plus ^ plus) | eq
+        up = minus | ~(horizontal | plus)
+        down = plus & horizontal
+        if up & last:
+            distance += 1
+        elif down & last:
+            distance -= 1
+
+        up = up << 1 | 1
+        down <<= 1
+        plus = (down | ~(vertical | up)) & full
+        minus = up & vertical & full
+
+    return distance
+
+
 def parameterize(name, iterable):
     params = {}
     for index, item in enumerate(iterable):
@@ -97,11 +189,14 @@ def parameterize(name, iterable):
 
 
 async def post(session, url, data=None, headers=None):
-    async with session.post(url, data=data, headers=headers) as response:
-        if response.status != 200:
-            raise aiohttp.ClientConnectionError(f"Could not post to {url}.") from None
-        text = await response.text()
-        return text.encode().decode("unicode-escape")
+    async def request():
+        async with session.post(url, data=data, headers=headers) as response:
+            if response.status != 200:
+                raise aiohttp.ClientConnectionError(f"Could not post to {url}.") from None
+            text = await response.text()
+            return text.encode().decode("unicode-escape")
+
+    return await single_flight("POST", url, None, data, request)
 
 
 def presence(text):
@@ -128,6 +223,15 @@ def reduce(arg, mode="dining"):
     return arg
 
 
+def rss():
+    # Resident memory in bytes, where the platform will say
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
 async def schedule(coro, times):
     times = [time_on(datetime.datetime.now(), time) for time in times]
     times.append(times[0] + datetime.timedelta(days=1))
@@ -136,6 +240,27 @@ async def schedule(coro, times):
     await coro()
 
 
+async def serve_metrics(port):
+    # Prometheus text at http://127.0.0.1:port/metrics; aiohttp.web only gets imported if someone wants it
+    from aiohttp import web
+
+    async def handle(_):
+        return web.Response(text=metrics.prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def soup(markup):
+    # bs4 takes a while to import, so it waits until the first scrape
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, "html.parser")
+
+
 def time_on(date, time):
     return datetime.datetime(*date.timetuple()[:3], time.hour, time.minute, time.second)
 
@@ -146,13 +271,38 @@ def to_time(time):
     return Time(hour + " " + period)
 
 
-# Slugs are lame
-UNIT_NAMES = reader("vandybot/helper/dining")
-UNIT_NAMES.update(reader("vandybot/helper/suzies"))
+# Slugs are lame, but nobody needs the names until the first command
+@functools.lru_cache(maxsize=None)
+def unit_names():
+    names = reader("vandybot/helper/dining")
+    names.update(reader("vandybot/helper/suzies"))
+    return names
+
+
+def write_snapshot(filename, version, sections):
+    # Sections are plain JSON so class changes can't break old snapshots
+    blobs = {name: json.dumps(section, separators=(",", ":")).encode() for name, section in sections.items()}
+    index, offset = {}, 0
+    for name, blob in blobs.items():
+        index[name] = (offset, len(blob))
+        offset += len(blob)
+
+    header = json.dumps({"version": version, "index": index}).encode()
+
+    # Write it all next door, then swap it in
+    with open(f"{filename}.tmp", "wb") as snapshot_file:
+        snapshot_file.write(SNAPSHOT_MAGIC + struct.pack("<I", len(header)) + header)
+        for blob in blobs.values():
+            snapshot_file.write(blob)
+
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+
+    os.replace(f"{filename}.tmp", filename)
 
 
 def unit_name(unit):
-    return UNIT_NAMES.get(unit, unit)
+    return unit_names().get(unit, unit)
 
 
 class TooManySelections(Exception):
@@ -161,18 +311,651 @@ class TooManySelections(Exception):
         super().__init__(message.format(max_count))
 
 
+class Debouncer:
+    # Bursts of calls for the same key become one call, made once the window closes
+    def __init__(self, delay):
+        self.delay = delay
+        self.stats = {"requested": 0, "run": 0}
+
+        self._pending = {}
+
+    def __call__(self, key, coro_func):
+        self.stats["requested"] += 1
+        if key not in self._pending:
+            asyncio.ensure_future(self._run(key))
+
+        # Only the latest one matters
+        self._pending[key] = coro_func
+
+    @property
+    def saved(self):
+        return self.stats["requested"] - self.stats["run"] - len(self._pending)
+
+    async def _run(self, key):
+        await asyncio.sleep(self.delay)
+        coro_func = self._pending.pop(key)
+        self.stats["run"] += 1
+        try:
+            await coro_func()
+        except Exception as error:
+            print(f"Debounced call for {key} failed: {error}")
+
+
+class SingleFlight:
+    # Identical requests already on their way share the one answer
+    def __init__(self):
+        self.stats = {"requested": 0, "coalesced": 0}
+
+        self._in_flight = {}
+
+    def __str__(self):
+        return f"{self.stats['coalesced']} of {self.stats['requested']} requests coalesced"
+
+    async def __call__(self, method, url, params, body, coro_func):
+        key = method, url, self.freeze(params), self.freeze(body)
+        self.stats["requested"] += 1
+        if key in self._in_flight:
+            self.stats["coalesced"] += 1
+        else:
+            self._in_flight[key] = asyncio.ensure_future(self._run(key, coro_func))
+
+        # One impatient caller shouldn't cancel it for everyone
+        return await asyncio.shield(self._in_flight[key])
+
+    @staticmethod
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted(value.items()))
+        elif isinstance(value, list):
+            return tuple(value)
+        else:
+            return value
+
+    async def _run(self, key, coro_func):
+        try:
+            return await coro_func()
+        finally:
+            del self._in_flight[key]
+
+
+class Metrics:
+    # Counters and histograms, plus anything else that can report itself when asked
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        # (name, labels): value
+        self.counters = collections.defaultdict(float)
+
+        # (name, labels): [count per bucket..., sum, count]
+        self.histograms = {}
+
+        # Each returns [(name, kind, labels, value)]
+        self._collectors = []
+
+    def collect(self, collector):
+        self._collectors.append(collector)
+
+    def count(self, name, amount=1, **labels):
+        self.counters[name, tuple(sorted(labels.items()))] += amount
+
+    def observe(self, name, value, **labels):
+        key = name, tuple(sorted(labels.items()))
+        if key not in self.histograms:
+            self.histograms[key] = [0] * (len(self.BUCKETS) + 3)
+
+        histogram = self.histograms[key]
+        histogram[bisect.bisect_left(self.BUCKETS, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def prometheus(self):
+        def labeled(labels):
+            escaped = (f'{name}="{str(value).translate(PROMETHEUS_ESCAPES)}"' for name, value in labels)
+            return "{" + ",".join(escaped) + "}" if labels else ""
+
+        families = collections.defaultdict(list)
+        for (name, labels), value in self.counters.items():
+            families[name, "counter"].append((labels, value))
+        for name, kind, labels, value in self.samples():
+            families[name, kind].append((tuple(sorted(labels.items())), value))
+
+        lines = []
+        for (name, kind), samples in sorted(families.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f"{name}{labeled(labels)} {value}" for labels, value in sorted(samples, key=str)]
+
+        # One TYPE line per name, or the whole scrape gets rejected
+        histograms = collections.defaultdict(list)
+        for (name, labels), histogram in sorted(self.histograms.items(), key=str):
+            histograms[name].append((labels, histogram))
+
+        for name, labeled_histograms in histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in labeled_histograms:
+                for bound, cumulative in zip((*self.BUCKETS, "+Inf"), itertools.accumulate(histogram[:-2])):
+                    lines.append(f"{name}_bucket{labeled((*labels, ('le', bound)))} {cumulative}")
+                lines.append(f"{name}_sum{labeled(labels)} {histogram[-2]}")
+                lines.append(f"{name}_count{labeled(labels)} {histogram[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+    def quantile(self, name, fraction, **labels):
+        # Upper bound of the bucket it lands in, which is as good as a histogram gets
+        histogram = self.histograms.get((name, tuple(sorted(labels.items()))))
+        if not histogram or not histogram[-1]:
+            return None
+
+        for bound, cumulative in zip((*self.BUCKETS, float("inf")), itertools.accumulate(histogram[:-2])):
+            if cumulative >= fraction * histogram[-1]:
+                return bound
+
+    def samples(self):
+        return [sample for collector in self._collectors for sample in collector()]
+
+    def summary(self):
+        # The highlights, for humans
+        def timing(name, **labels):
+            bounds = [self.quantile(name, fraction, **labels) for fraction in (0.5, 0.95)]
+            if bounds[0] is None:
+                return "no timings"
+
+            p50, p95 = (f"under {bound * 1000:.0f} ms" if bound != float("inf") else f"over {self.BUCKETS[-1]} s"
+                        for bound in bounds)
+            return f"p50 {p50}, p95 {p95}"
+
+        def labeled(name, samples):
+            return [(dict(labels), value) for (sample_name, labels), value in samples if sample_name == name]
+
+        counters = self.counters.items()
+        samples = [((name, tuple(sorted(labels.items()))), value) for name, kind, labels, value in self.samples()]
+        histograms = [(key, histogram[-1]) for key, histogram in self.histograms.items()]
+
+        runs = {labels["command"]: count for labels, count in labeled("vandybot_command_seconds", histograms)}
+        commands_text = [f"~{command}: {count} runs, {timing('vandybot_command_seconds', command=command)}"
+                         for command, count in sorted(runs.items())]
+
+        requests, failures = collections.Counter(), collections.Counter()
+        for labels, count in labeled("vandybot_upstream_requests_total", counters):
+            requests[labels["host"]] += count
+            if labels["status"] == "error" or labels["status"] >= 400:
+                failures[labels["host"]] += count
+        upstream_text = [f"{host}: {count:.0f} requests ({failures[host]:.0f} failed), "
+                         f"{timing('vandybot_upstream_seconds', host=host)}"
+                         for host, count in sorted(requests.items())]
+
+        refreshes = sum(count for _, count in labeled("vandybot_refresh_seconds", histograms))
+        retries = sum(count for _, count in labeled("vandybot_refresh_retries_total", counters))
+        ages = [age for _, age in labeled("vandybot_menu_age_seconds", samples)]
+        refresh_text = [f"{refreshes} refreshes, {timing('vandybot_refresh_seconds')}", f"{retries:.0f} retries"]
+        if ages:
+            refresh_text.append(f"Menu is {max(ages) / 3600:.1f} hours old")
+
+        slowest = labeled("vandybot_refresh_request_seconds", samples)
+        if slowest:
+            labels, seconds = max(slowest, key=lambda sample: sample[1])
+            refresh_text.append(f"Slowest request was {labels['resource']} at {seconds:.2f}s")
+
+        events = collections.defaultdict(collections.Counter)
+        for labels, count in labeled("vandybot_cache_events_total", samples):
+            events[labels["cache"]][labels["event"]] += count
+        cache_text = []
+        for labels, entries in labeled("vandybot_cache_entries", samples):
+            cache = events[labels["cache"]]
+            lookups = cache["hits"] + cache["misses"]
+            hit_rate = f", {cache['hits'] / lookups:.0%} hits" if lookups else ""
+            cache_text.append(f"{labels['cache']}: {entries} entries{hit_rate}")
+
+        discord_text = [f"{count} {labels['priority']}" for labels, count in
+                        labeled("vandybot_discord_calls_total", samples)]
+
+        return {"Commands": "\n".join(commands_text) or "None yet",
+                "Upstream": "\n".join(upstream_text) or "None yet",
+                "Refresh": "\n".join(refresh_text),
+                "Caches": "\n".join(cache_text) or "None yet",
+                "Discord Calls": joiner(discord_text) or "None yet"}
+
+    def track_cache(self, name, cache):
+        self.collect(lambda: [("vandybot_cache_entries", "gauge", {"cache": name}, len(cache)),
+                              *(("vandybot_cache_events_total", "counter", {"cache": name, "event": event}, count)
+                                for event, count in cache.stats.items())])
+
+
+metrics = Metrics()
+
+
+class HTTPClient:
+    # One connection pool for every cog
+    def __init__(self, limit=32, limit_per_host=8, host_limits=None, dns_ttl=300, keepalive=30, timeout=20):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.host_limits = host_limits or {}
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+        # host: {stat: count}
+        self.stats = collections.defaultdict(lambda: collections.Counter())
+        self.trace = aiohttp.TraceConfig()
+        self.trace.on_request_start.append(self._on_request_start)
+        self.trace.on_request_end.append(self._on_request_end)
+        self.trace.on_request_exception.append(self._on_request_exception)
+        self.trace.on_connection_create_end.append(self._on_connection_create_end)
+        self.trace.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        self.trace.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        self.trace.on_dns_cache_miss.append(self._on_dns_cache_miss)
+
+        self._connector = None
+        self._limits = {}
+        self._sessions = []
+        self._default = self.session()
+
+    def __str__(self):
+        return "; ".join(f"{host}: {stats['requests']} requests over {stats['connections']} connections "
+                         f"({stats['reused']} reuses)" for host, stats in self.stats.items())
+
+    @property
+    def connector(self):
+        if self._connector is None or self._connector.closed:
+            # The semaphores do the per-host limiting, so the pool only needs room for the biggest one
+            per_host = max([self.limit_per_host, *self.host_limits.values()])
+            self._connector = aiohttp.TCPConnector(limit=self.limit,
+                                                   limit_per_host=per_host,
+                                                   ttl_dns_cache=self.dns_ttl,
+                                                   keepalive_timeout=self.keepalive)
+        return self._connector
+
+    async def close(self):
+        for session in self._sessions:
+            await session.close()
+
+        if self._connector is not None:
+            await self._connector.close()
+
+    def get(self, url, **kwargs):
+        return self._default.get(url, **kwargs)
+
+    def host_limit(self, url):
+        host = urllib.parse.urlsplit(url).hostname
+        if host not in self._limits:
+            self._limits[host] = asyncio.Semaphore(self.host_limits.get(host, self.limit_per_host))
+
+        return self._limits[host]
+
+    def post(self, url, **kwargs):
+        return self._default.post(url, **kwargs)
+
+    def session(self):
+        # Shares the pool but not the cookies
+        session = HTTPSession(self)
+        self._sessions.append(session)
+        return session
+
+    async def _on_connection_create_end(self, _, context, params):
+        self.stats[context.host]["connections"] += 1
+
+    async def _on_connection_reuseconn(self, _, context, params):
+        self.stats[context.host]["reused"] += 1
+
+    async def _on_dns_cache_hit(self, _, context, params):
+        self.stats[params.host]["dns hits"] += 1
+
+    async def _on_dns_cache_miss(self, _, context, params):
+        self.stats[params.host]["dns misses"] += 1
+
+    async def _on_request_end(self, _, context, params):
+        metrics.count("vandybot_upstream_requests_total", host=context.host, status=params.response.status)
+        metrics.observe("vandybot_upstream_seconds", perf_counter() - context.start, host=context.host)
+
+    async def _on_request_exception(self, _, context, params):
+        metrics.count("vandybot_upstream_requests_total", host=context.host, status="error")
+        metrics.observe("vandybot_upstream_seconds", perf_counter() - context.start, host=context.host)
+
+    async def _on_request_start(self, _, context, params):
+        context.host = params.url.host
+        context.start = perf_counter()
+        self.stats[context.host]["requests"] += 1
+
+
+class HTTPSession:
+    def __init__(self, client):
+        self._client = client
+        self._session = None
+
+    @property
+    def session(self):
+        # Made on first use so it lands on the running loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=self._client.connector, connector_owner=False,
+                                                  timeout=self._client.timeout, trace_configs=[self._client.trace])
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, **kwargs):
+        async with self._client.host_limit(url):
+            async with self.session.request(method, url, **kwargs) as response:
+                yield response
+
+
+class SessionPool:
+    # Sessions with their own cookies, handed out one caller at a time
+    def __init__(self, client, size, reset=None):
+        self.size = size
+        self.stats = {"checkouts": 0, "waits": 0, "wait time": 0.0, "longest wait": 0.0}
+
+        self._client = client
+        self._idle = None
+        self._reset = reset
+
+    def __str__(self):
+        average = self.stats["wait time"] / self.stats["waits"] * 1000 if self.stats["waits"] else 0
+        return f"{self.idle}/{self.size} idle, {self.stats['checkouts']} checkouts, " \
+               f"{self.stats['waits']} waited (averaging {average:.0f} ms, longest " \
+               f"{self.stats['longest wait'] * 1000:.0f} ms)"
+
+    @property
+    def idle(self):
+        return self.size if self._idle is None else self._idle.qsize()
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        if self._idle is None:
+            # Made on first use so it lands on the running loop
+            self._idle = asyncio.Queue()
+            for _ in range(self.size):
+                self._idle.put_nowait(self._client.session())
+
+        self.stats["checkouts"] += 1
+        if self._idle.empty():
+            start = monotonic()
+            session = await self._idle.get()
+            waited = monotonic() - start
+
+            self.stats["waits"] += 1
+            self.stats["wait time"] += waited
+            self.stats["longest wait"] = max(self.stats["longest wait"], waited)
+        else:
+            session = self._idle.get_nowait()
+
+        try:
+            yield session
+        finally:
+            # The caller doesn't need to wait around for the cleanup
+            asyncio.ensure_future(self._release(session))
+
+    async def _release(self, session):
+        try:
+            if self._reset is not None:
+                await self._reset(session)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Start over with fresh cookies instead
+            await session.close()
+        finally:
+            self._idle.put_nowait(session)
+
+
+http_client = HTTPClient(host_limits=HOST_LIMITS)
+single_flight = SingleFlight()
+
+metrics.collect(lambda: [("vandybot_upstream_connections_total", "counter", {"host": host, "kind": kind}, stats[kind])
+                         for host, stats in http_client.stats.items() for kind in ("connections", "reused")])
+
+
+class LRUCache:
+    # Least recently used goes first, and nothing outlives its TTL
+    def __init__(self, size, ttl, on_evict=None):
+        self.size = size
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        # key: (expiry, value)
+        self._entries = collections.OrderedDict()
+        self._on_evict = on_evict
+
+    def __contains__(self, key):
+        try:
+            return self._entries[key][0] > monotonic() or self._expire(key)
+        except KeyError:
+            return False
+
+    def __getitem__(self, key):
+        try:
+            expiry, value = self._entries[key]
+        except KeyError:
+            self.stats["misses"] += 1
+            raise
+
+        if expiry <= monotonic():
+            self._expire(key)
+            self.stats["misses"] += 1
+            raise KeyError(key)
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __setitem__(self, key, value):
+        self._entries[key] = (monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.size:
+            self.stats["evictions"] += 1
+            self._evict(*self._entries.popitem(last=False))
+
+    def _evict(self, key, entry):
+        if self._on_evict is not None:
+            self._on_evict(key, entry[1])
+
+    def _expire(self, key):
+        self.stats["expirations"] += 1
+        self._evict(key, self._entries.pop(key))
+        return False
+
+    def prune(self):
+        current = monotonic()
+        for key in [key for key, (expiry, _) in self._entries.items() if expiry <= current]:
+            self._expire(key)
+
+
+class Outbox:
+    # Discord calls wait their turn per channel, and replies always cut the line
+    REPLY = 0
+    DECORATE = 1
+    CLEANUP = 2
+
+    NAMES = ("reply", "decorate", "cleanup")
+
+    def __init__(self):
+        self.stats = {name: {"calls": 0, "wait time": 0.0, "longest wait": 0.0} for name in self.NAMES}
+
+        # channel ID: queue of (priority, order, queued, coro_func, future)
+        self._queues = {}
+        self._order = itertools.count()
+
+    def __len__(self):
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def __str__(self):
+        return joiner([f"{stats['calls']} {name} calls (longest wait {stats['longest wait'] * 1000:.0f} ms)"
+                       for name, stats in self.stats.items()])
+
+    def decorate(self, message, reaction):
+        # Nobody waits on these
+        self.post(message.channel.id, self.DECORATE, functools.partial(message.add_reaction, reaction))
+
+    def edit(self, message, **kwargs):
+        return self.submit(message.channel.id, self.REPLY, functools.partial(message.edit, **kwargs))
+
+    def post(self, bucket, priority, coro_func):
+        self.submit(bucket, priority, coro_func).add_done_callback(self._report)
+
+    def remove(self, message, reaction, member):
+        return self.submit(message.channel.id, self.CLEANUP,
+                           functools.partial(message.remove_reaction, reaction, member))
+
+    def send(self, destination, *args, **kwargs):
+        # Contexts and channels both work
+        bucket = getattr(destination, "channel", destination).id
+        return self.submit(bucket, self.REPLY, functools.partial(destination.send, *args, **kwargs))
+
+    def submit(self, bucket, priority, coro_func):
+        future = asyncio.get_event_loop().create_future()
+        if bucket not in self._queues:
+            self._queues[bucket] = asyncio.PriorityQueue()
+            asyncio.ensure_future(self._work(bucket))
+
+        self._queues[bucket].put_nowait((priority, next(self._order), monotonic(), coro_func, future))
+        return future
+
+    @staticmethod
+    def _report(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Queued Discord call failed: {future.exception()}")
+
+    async def _work(self, bucket):
+        # One call at a time per channel, since they share Discord's rate limits anyway
+        queue = self._queues[bucket]
+        while not queue.empty():
+            priority, _, queued, coro_func, future = queue.get_nowait()
+            if future.cancelled():
+                continue
+
+            stats = self.stats[self.NAMES[priority]]
+            waited = monotonic() - queued
+            stats["calls"] += 1
+            stats["wait time"] += waited
+            stats["longest wait"] = max(stats["longest wait"], waited)
+
+            try:
+                result = await coro_func()
+            except Exception as error:
+                if not future.cancelled():
+                    future.set_exception(error)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+        del self._queues[bucket]
+
+
+outbox = Outbox()
+
+metrics.collect(lambda: [("vandybot_discord_calls_total", "counter", {"priority": name}, stats["calls"])
+                         for name, stats in outbox.stats.items()])
+metrics.collect(lambda: [("vandybot_coalesced_requests_total", "counter", {}, single_flight.stats["coalesced"])])
+
+
+class ReadThroughCache:
+    # Loads on a miss, reloads ahead of expiry, and hangs onto the last good copy when the source is down
+    def __init__(self, loader, ttl, refresh_ahead=0.8, retry_delay=60):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.retry_delay = retry_delay
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "failures": 0}
+
+        # key: (loaded, expiry, value)
+        self._entries = {}
+        self._loader = loader
+        self._loading = {}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key=None):
+        try:
+            loaded, expiry, value = self._entries[key]
+        except KeyError:
+            self.stats["misses"] += 1
+            return await self.refresh(key)
+
+        current = monotonic()
+        if current >= expiry:
+            self.stats["misses"] += 1
+            return await self.refresh(key)
+
+        self.stats["hits"] += 1
+        if current >= loaded + (expiry - loaded) * self.refresh_ahead and key not in self._loading:
+            # Get a head start on the next one
+            asyncio.ensure_future(self.refresh(key))
+
+        return value
+
+    def invalidate(self, key=None):
+        self._entries.pop(key, None)
+
+    def keys(self):
+        return self._entries.keys()
+
+    async def refresh(self, key=None):
+        # Everyone waits on the same load
+        if key not in self._loading:
+            self._loading[key] = asyncio.ensure_future(self._load(key))
+
+        return await asyncio.shield(self._loading[key])
+
+    async def _load(self, key):
+        try:
+            value = await self._loader(key)
+            ttl = self.ttl(key) if callable(self.ttl) else self.ttl
+            self._entries[key] = (monotonic(), monotonic() + ttl, value)
+            self.stats["refreshes"] += 1
+            return value
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.stats["failures"] += 1
+            if key not in self._entries:
+                raise
+
+            # Stale beats nothing; check back in a bit
+            loaded, _, value = self._entries[key]
+            self._entries[key] = (loaded, monotonic() + self.retry_delay, value)
+            return value
+        finally:
+            del self._loading[key]
+
+
 class Day:
     DAYS = ("Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday",
             "Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat",
             "U", "M", "T", "W", "R", "F", "S")
+    INDICES = {day: index % 7 for index, day in enumerate(DAYS)}
 
-    def __init__(self, day="Sunday"):
-        day = day.capitalize()
+    # There are only ever seven of these
+    __slots__ = ("day",)
+    _instances = ()
 
+    def __new__(cls, day="Sunday"):
         try:
-            self.day = self.DAYS.index(day) % 7
-        except ValueError:
-            raise ValueError(f"{day} is not a valid day of the week.") from None
+            return cls._instances[cls.INDICES[day.capitalize()]]
+        except KeyError:
+            raise ValueError(f"{day.capitalize()} is not a valid day of the week.") from None
+
+    @classmethod
+    def _create(cls, index):
+        instance = super().__new__(cls)
+        object.__setattr__(instance, "day", index)
+        return instance
+
+    @classmethod
+    def of(cls, index):
+        return cls._instances[index % 7]
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Days are immutable.")
 
     def __hash__(self):
         return self.day
@@ -184,7 +967,13 @@ class Day:
         return self.DAYS[self.day]
 
     def __copy__(self):
-        return Day(self.DAYS[self.day])
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return Day, (str(self),)
 
     def __lt__(self, other):
         try:
@@ -197,8 +986,8 @@ class Day:
 
     def __eq__(self, other):
         try:
-            return int(self) == int(other)
-        except ValueError:
+            return self.day == int(other)
+        except (TypeError, ValueError):
             return False
 
     def __ge__(self, other):
@@ -211,46 +1000,52 @@ class Day:
             return False
 
     def __add__(self, other):
-        return Day(self.DAYS[(self.day + int(other)) % 7])
-
-    def __iadd__(self, other):
-        self.day += int(other)
-        self.day %= 7
-        return self
+        return self._instances[(self.day + int(other)) % 7]
 
     def __sub__(self, other):
-        return Day(self.DAYS[(self.day - int(other)) % 7])
-
-    def __isub__(self, other):
-        self.day -= int(other)
-        self.day %= 7
-        return self
+        return self._instances[(self.day - int(other)) % 7]
 
     @property
     def is_today(self):
-        return self == today()
+        return self.day == int(today())
 
     @property
     def is_tomorrow(self):
-        return self == tomorrow()
+        return self.day == int(tomorrow())
 
     @property
     def relative_day(self):
-        return (self.day - int(datetime.datetime.now().strftime("%w"))) % 7
+        return (self.day - int(today())) % 7
 
 
-now = datetime.datetime.now
+Day._instances = tuple(map(Day._create, range(7)))
+
+# Commands set this so a whole render agrees on the time
+_clock = contextvars.ContextVar("clock", default=None)
+
+
+@contextlib.contextmanager
+def clock():
+    token = _clock.set(datetime.datetime.now())
+    try:
+        yield
+    finally:
+        _clock.reset(token)
+
+
+def now():
+    return _clock.get() or datetime.datetime.now()
 
 
 def today():
-    return Day(datetime.datetime.now().strftime("%A"))
+    return Day.of(now().isoweekday())
 
 
 def tomorrow():
-    return today() + 1
+    return Day.of(now().isoweekday() + 1)
 
 
-week = tuple(map(Day, Day.DAYS[:7]))
+week = tuple(map(Day.of, range(7)))
 weekend = (Day("Saturday"), Day("Sunday"))
 
 
@@ -258,12 +1053,387 @@ class Time(datetime.time):
     MIN = datetime.time(0, 0)
     MAX = datetime.time(23, 59)
 
+    # Every time string ever parsed
+    _parsed = {}
+
     def __new__(cls, time="12:00 AM"):
+        try:
+            return cls._parsed[time]
+        except KeyError:
+            pass
+
         split = time.split(":")
-        return super().__new__(cls, (int(split[0]) % 12) + 12 * (time.split()[1].upper() == "PM"),
-                               int(split[1].split()[0]))
+        parsed = cls._parsed[time] = super().__new__(cls, (int(split[0]) % 12) + 12 * (time.split()[1].upper() == "PM"),
+                                                     int(split[1].split()[0]))
+        return parsed
+
+    @classmethod
+    def at(cls, hour, minute=0):
+        return super().__new__(cls, hour, minute)
+
+    def __reduce_ex__(self, protocol):
+        # datetime.time pickles as bytes, which __new__ doesn't take
+        return self.at, (self.hour, self.minute)
 
     def __str__(self):
         return "{}:{} {}".format(self.hour % 12 + 12 * (self.hour % 12 == 0),
                                  str(self.minute).zfill(2),
                                  "AM" if self.hour < 12 else "PM")
+
+
+class Resolver:
+    # Every alias any command understands, with a BK-tree for the typos
+    MAX_DISTANCE = 1
+    MAX_SUGGESTION_DISTANCE = 2
+    MIN_FUZZY_LENGTH = 4
+
+    def __init__(self):
+        # alias: {kind: value}
+        self.aliases = {}
+
+        # [alias, {distance: child}]
+        self._tree = None
+
+    def __contains__(self, alias):
+        return alias in self.aliases
+
+    def add(self, kind: str, table: dict):
+        for alias, value in table.items():
+            if alias not in self.aliases:
+                self.aliases[alias] = {}
+                self._insert(alias)
+
+            self.aliases[alias][kind] = value
+
+    def near(self, arg: str, radius: int):
+        # Triangle inequality means most of the tree never gets looked at
+        found = []
+        nodes = [self._tree] if self._tree is not None else []
+        while nodes:
+            alias, children = nodes.pop()
+            distance = levenshtein(arg, alias)
+            if distance <= radius:
+                found.append((distance, alias))
+
+            nodes += [child for edge, child in children.items() if distance - radius <= edge <= distance + radius]
+
+        return sorted(found)
+
+    def resolve(self, arg: str, kinds: tuple):
+        # Kinds are in order of preference
+        entry = self.aliases.get(arg, {})
+        for kind in kinds:
+            if kind in entry:
+                return kind, entry[kind]
+
+        # Let small typos slide if there's only one thing they could mean
+        candidates = [(distance, alias, self.resolve(alias, kinds))
+                      for distance, alias in self.near(arg, self.MAX_SUGGESTION_DISTANCE)
+                      if any(kind in self.aliases[alias] for kind in kinds)]
+        closest = [token for distance, alias, token in candidates if distance <= self.MAX_DISTANCE]
+        if len(arg) >= self.MIN_FUZZY_LENGTH and closest and all(token == closest[0] for token in closest):
+            return closest[0]
+
+        message = f"Invalid argument provided: {arg}"
+        if candidates:
+            message += f". Did you mean {joiner([code(alias) for _, alias, _ in candidates[:3]])}?"
+
+        raise BadArgument(message)
+
+    def _insert(self, alias):
+        if self._tree is None:
+            self._tree = [alias, {}]
+            return
+
+        node = self._tree
+        while True:
+            distance = levenshtein(alias, node[0])
+            if distance not in node[1]:
+                node[1][distance] = [alias, {}]
+                return
+
+            node = node[1][distance]
+
+
+# Every cog adds its own tables on startup
+resolver = Resolver()
+resolver.add("day", {day.lower(): Day(day) for day in Day.DAYS})
+resolver.add("relative day", {"today": today, "tomorrow": tomorrow})
+
+
+class Validators:
+    # url: (etag, last modified, digest, parsed)
+    def __init__(self, filename, version=0, encode=None, decode=None):
+        self._filename = filename
+        self._version = version
+
+        # Parses are saved as plain JSON so class changes can't break old ones
+        self._encode = encode or (lambda value: value)
+        self._decode = decode or (lambda value: value)
+
+        self._entries = {}
+        try:
+            with open(filename) as validators_file:
+                saved = json.load(validators_file)
+
+            # Old parses are useless
+            if saved["version"] == version:
+                self._entries = {url: (etag, modified, digest, self._decode(value))
+                                 for url, (etag, modified, digest, value) in saved["entries"].items()}
+        except (OSError, AttributeError, KeyError, TypeError, ValueError):
+            self._entries = {}
+
+        self._seen = set()
+        self.counts = {"unchanged": 0, "changed": 0, "failed": 0}
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def __str__(self):
+        return ", ".join(f"{count} {name}" for name, count in self.counts.items())
+
+    def changed(self, url, etag, modified, digest, value):
+        self._entries[url] = (etag, modified, digest, value)
+        self._seen.add(url)
+        self.counts["changed"] += 1
+        return value
+
+    def digest(self, url):
+        return self._entries.get(url, (None, None, None, None))[2]
+
+    def failed(self, url):
+        # Stale is better than nothing
+        self._seen.add(url)
+        self.counts["failed"] += 1
+        return self._entries[url][3]
+
+    def headers(self, url):
+        headers = {}
+        if url in self._entries:
+            etag, modified, *_ = self._entries[url]
+            if etag:
+                headers["If-None-Match"] = etag
+            if modified:
+                headers["If-Modified-Since"] = modified
+
+        return headers
+
+    def reset(self):
+        self._seen = set()
+        self.counts = dict.fromkeys(self.counts, 0)
+
+    def save(self):
+        # Forget anything the last pass didn't touch
+        self._entries = {url: entry for url, entry in self._entries.items() if url in self._seen}
+        entries = {url: (etag, modified, digest, self._encode(value))
+                   for url, (etag, modified, digest, value) in self._entries.items()}
+
+        # Write it all next door, then swap it in
+        with open(f"{self._filename}.tmp", "w") as validators_file:
+            json.dump({"version": self._version, "entries": entries}, validators_file, separators=(",", ":"))
+
+        os.replace(f"{self._filename}.tmp", self._filename)
+
+    def unchanged(self, url, etag=None, modified=None):
+        old_etag, old_modified, digest, value = self._entries[url]
+        self._entries[url] = (etag or old_etag, modified or old_modified, digest, value)
+        self._seen.add(url)
+        self.counts["unchanged"] += 1
+        return value
+
+
+class Snapshot:
+    # Sections are only decoded when asked for
+    def __init__(self, filename):
+        with open(filename, "rb") as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:4] != SNAPSHOT_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{filename} is not a snapshot.")
+
+        try:
+            length, = struct.unpack("<I", self._mmap[4:8])
+            header = json.loads(self._mmap[8:8 + length])
+            self._base = 8 + length
+            self._index = header["index"]
+            self.version = header["version"]
+        except (struct.error, KeyError, TypeError, ValueError):
+            # Truncated or mangled, which is as good as missing
+            self._mmap.close()
+            raise ValueError(f"{filename} has a damaged header.") from None
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        offset, length = self._index[name]
+        return json.loads(self._mmap[self._base + offset:self._base + offset + length])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def close(self):
+        self._mmap.close()
+
+
+class StartupProfile:
+    # Where the cold start went
+    def __init__(self):
+        self.launched = perf_counter()
+        self.phases = {}
+
+    def __str__(self):
+        return joiner([f"{name} {elapsed:.2f}s" for name, elapsed in self.phases.items()])
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + perf_counter() - start
+
+    def imported(self, launched):
+        # The clock has to start before anything gets imported
+        self.launched = launched
+        self.phases["import"] = perf_counter() - launched
+
+    def ready(self):
+        # Reconnects don't count
+        if "first ready" not in self.phases:
+            self.phases["first ready"] = perf_counter() - self.launched
+            print(f"Startup profile: {self}")
+
+
+startup_profile = StartupProfile()
+
+
+class Profiler:
+    # Samples the event loop's stack from another thread, but only while someone asked for it
+    INTERVAL = 0.005
+    TOP = 10
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.target = None
+        self.remaining = 0
+
+        # code: label
+        self._labels = {}
+        self._report = None
+        self._stacks = collections.Counter()
+        self._started = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __str__(self):
+        if self.target is None:
+            return "not profiling"
+
+        return f"waiting on {self.remaining} {self.target}{' (sampling)' if self._thread else ''}"
+
+    def arm(self, target, count, report):
+        # Runs are never interrupted
+        if self._thread is not None:
+            return False
+
+        self.target, self.remaining, self._report = target, count, report
+        return True
+
+    def begin(self, target):
+        # Just a comparison when nobody is profiling
+        if target != self.target or self._thread is not None:
+            return
+
+        self._stacks.clear()
+        self._stop.clear()
+        self._started = perf_counter()
+        self._thread = threading.Thread(target=self._sample, args=(threading.get_ident(),), daemon=True)
+        self._thread.start()
+
+    def end(self, target):
+        if target != self.target or self._thread is None:
+            return
+
+        self.remaining -= 1
+        if self.remaining > 0:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        elapsed = perf_counter() - self._started
+        self._thread = self.target = None
+
+        path = self.save(target)
+        asyncio.ensure_future(self._report(f"Profiled {target} for {elapsed:.2f}s, saved to {path}\n\n"
+                                           f"{self.summary()}"))
+
+    def label(self, frame):
+        code = frame.f_code
+        if code not in self._labels:
+            self._labels[code] = f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+        return self._labels[code]
+
+    def profiled(self, target):
+        def decorator(coro_func):
+            @functools.wraps(coro_func)
+            async def wrapper(*args, **kwargs):
+                self.begin(target)
+                try:
+                    return await coro_func(*args, **kwargs)
+                finally:
+                    self.end(target)
+
+            return wrapper
+
+        return decorator
+
+    def save(self, target):
+        # Collapsed stacks, ready for flamegraph.pl or speedscope
+        os.makedirs(self.directory, exist_ok=True)
+        path = f"{self.directory}/{datetime.datetime.now():%Y-%m-%d-%H%M%S}-{target}.folded"
+        with open(path, "w") as file:
+            file.writelines(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+        return path
+
+    def summary(self):
+        total = sum(self._stacks.values())
+        if not total:
+            return "No samples"
+
+        own, inclusive = collections.Counter(), collections.Counter()
+        idle = 0
+        for stack, count in self._stacks.items():
+            frames = stack.split(";")
+            if frames[-1].startswith("selectors."):
+                # Waiting on the network or a timer
+                idle += count
+                continue
+
+            own[frames[-1]] += count
+            inclusive.update(dict.fromkeys(frames, count))
+
+        lines = [f"{total} samples, {idle / total:.0%} idle", "", f"{'self':>6}{'total':>7}  function"]
+        lines += [f"{count / total:>6.1%}{inclusive[name] / total:>7.1%}  {name}"
+                  for name, count in own.most_common(self.TOP)]
+
+        ours = [(name, count) for name, count in inclusive.most_common() if name.startswith("vandybot.")]
+        lines += ["", f"{'':>6}{'total':>7}  in VandyBot"]
+        lines += [f"{'':>6}{count / total:>7.1%}  {name}" for name, count in ours[:self.TOP]]
+        return "\n".join(lines)
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame))
+                frame = frame.f_back
+
+            self._stacks[";".join(reversed(stack))] += 1
+
+
+profiler = Profiler("vandybot/profiles")
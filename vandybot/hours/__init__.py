@@ -42,10 +42,26 @@ class Hours(commands.Cog):
     POST_OFFICE_URL = "https://www.vanderbilt.edu/mailservices/contact-us/locations-hours-services.php"
     REC_URL = "https://www.vanderbilt.edu/recreationandwellnesscenter/"
 
+    # Refresh times
+    SCHEDULE = [Time("4:20 AM")]
+
+    # Argument types, in order of preference
+    ARG_KINDS = ("dining", "library", "post office", "bookstore", "rec", "relative day", "day")
+
+    # Cache lifetimes in seconds
+    OID_TTL = 86400
+    DINING_HOURS_TTL = 21600
+    DINING_HOURS_TTLS = {}
+
+    # NetNutrition sessions, which is also how many hours queries run at once
+    POOL_SIZE = 4
+
     def __init__(self, bot):
         self._bot = bot
-        self._conn = aiohttp.TCPConnector(limit=1)
-        self._session = aiohttp.ClientSession()
+        self._session = http_client
+
+        # NetNutrition remembers selections per cookie jar, so everyone gets their own
+        self._sessions = SessionPool(http_client, self.POOL_SIZE, self.reset)
         self._list = reader(f"{_dir}/list")
 
         self._bookstores = reader(f"{_dir}/bookstores")
@@ -54,11 +70,34 @@ class Hours(commands.Cog):
         self._post_offices = reader(f"{_dir}/post_offices")
         self._recs = reader(f"{_dir}/recs")
 
+        # Shared with Dining
+        resolver.add("dining", self._dining)
+        resolver.add("library", self._libraries)
+        resolver.add("post office", self._post_offices)
+        resolver.add("bookstore", self._bookstores)
+        resolver.add("rec", self._recs)
+
         self._loc_conditions = reader(f"{_dir}/loc_conditions")
 
-        # I'd like to use this but POST requests make it dumb
+        # Fallback for when NetNutrition's home page is down
         self._dining_oids = reader(f"{_dir}/dining_oids")
 
+        # Unit name: OID, and unit name: weekly hours
+        self._unit_oids = ReadThroughCache(self.load_dining_unit_oids, self.OID_TTL)
+        self._dining_hours = ReadThroughCache(self.load_dining_hours,
+                                              lambda unit: self.DINING_HOURS_TTLS.get(unit, self.DINING_HOURS_TTL))
+
+        # Library name: (weekly hours, footer), all from one page
+        self._library_hours = ReadThroughCache(self.load_library_hours, self.library_ttl)
+
+        metrics.track_cache("unit oids", self._unit_oids)
+        metrics.track_cache("dining hours", self._dining_hours)
+        metrics.track_cache("library hours", self._library_hours)
+        metrics.collect(lambda: [("vandybot_session_checkouts_total", "counter", {"waited": "false"},
+                                  self._sessions.stats["checkouts"] - self._sessions.stats["waits"]),
+                                 ("vandybot_session_checkouts_total", "counter", {"waited": "true"},
+                                  self._sessions.stats["waits"])])
+
         self._bookstore_hours = hours_reader(f"{_dir}/bookstore_hours")
         self._post_office_hours = hours_reader(f"{_dir}/post_office_hours")
         self._rec_hours = hours_reader(f"{_dir}/rec_hours")
@@ -72,7 +111,6 @@ class Hours(commands.Cog):
                                              f"~{loc} menu [day=today] [menu=next]\n"
                                              f"~{loc} menu [day] [meal=all]",
                                        hidden=True)
-            command.after_invoke(self.hours_reset)
             self._bot.add_command(command)
 
         for loc in self._libraries:
@@ -97,12 +135,35 @@ class Hours(commands.Cog):
         return False
 
     async def get_dining_hours(self, unit: str):
+        return await self._dining_hours.get(unit), "Dining areas may be open to students between listed meal periods"
+
+    async def get_dining_unit_oid(self, loc: str):
+        try:
+            units = await self._unit_oids.get()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Better than nothing
+            units = self._dining_oids
+
+        try:
+            return units[loc]
+        except KeyError:
+            raise UnitNotFound(loc) from None
+
+    async def get_library_hours(self, library: str):
+        try:
+            return (await self._library_hours.get())[library]
+        except KeyError:
+            raise HoursNotFound(library) from None
+
+    async def load_dining_hours(self, unit: str):
         unit_oid = await self.get_dining_unit_oid(unit)
-        response = await post(self._session, f"{self.DINING_URL}/Unit/GetHoursOfOperationMarkup",
-                              data={"unitOid": unit_oid},
-                              headers=self.DINING_HEADER)
-        soup = BeautifulSoup(response, "html.parser")
-        blocks = [Day(time) if time in Day.DAYS else time for time in map(BeautifulSoup.get_text, soup.find_all("td"))]
+        async with self._sessions.session() as session:
+            response = await post(session, f"{self.DINING_URL}/Unit/GetHoursOfOperationMarkup",
+                                  data={"unitOid": unit_oid},
+                                  headers=self.DINING_HEADER)
+
+        page = soup(response)
+        blocks = [Day(time) if time in Day.DAYS else time for time in (cell.get_text() for cell in page.find_all("td"))]
         index = 0
         hours = {}
 
@@ -122,46 +183,75 @@ class Hours(commands.Cog):
 
             index += 1
 
-        return hours, "Dining areas may be open to students between listed meal periods"
+        return hours
 
-    async def get_dining_hours_dispatch(self, slug: str):
-        return (await self.get_dining_hours(unit_name(slug)))[0]
-
-    async def get_dining_unit_oid(self, loc: str):
+    async def load_dining_unit_oids(self, _=None):
         response = await fetch(self._session, self.DINING_URL)
-        soup = BeautifulSoup(response, "html.parser")
+        page = soup(response)
 
         # NetNutrition put in ONE fancy quote and fucked everything up
         units = {}
-        for unit in soup.find_all(class_="d-flex flex-wrap col-9 p-0"):
+        for unit in page.find_all(class_="d-flex flex-wrap col-9 p-0"):
             words = unit.get_text().split()
             units[" ".join(words[1:] if words[0].startswith("Suzie") else words)] = find_oid(unit)
 
-        try:
-            return units[loc]
-        except KeyError:
-            raise UnitNotFound(loc) from None
+        return units
 
-    async def get_library_hours(self, library: str):
+    async def load_library_hours(self, _=None):
         response = await fetch(self._session, self.LIBRARY_URL)
-        soup = BeautifulSoup(response, "html.parser")
+        page = soup(response)
+
+        libraries = {}
+        for block in page.find_all("table", class_="table hours-table"):
+            footer = block.find("td").get_text().split("  ")[0]
+            hours = {Day(day.get_text().strip()[:3]):
+                     [tuple(to_time(span) for span in time.get_text().strip().split("-"))]
+                     if time.get_text().strip().lower() != "closed" else ["Closed"]
+                     for day, time in zip(block.find_all("th")[1:], block.find_all("td")[1:])}
+            libraries[block.find("th").get_text()] = hours, footer
+
+        return libraries
+
+    def library_ttl(self, _=None):
+        # The page is posted a week at a time, so keep it until Sunday rolls around
+        current = now()
+        days = 7 - current.isoweekday() % 7
+        boundary = datetime.datetime.combine(current.date() + datetime.timedelta(days=days), datetime.time())
+        return (boundary - current).total_seconds()
+
+    async def prefetch_dining_hours(self, units):
+        # One OID lookup, then every unit at once
+        try:
+            await self._unit_oids.refresh()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            print("VandyBot could not access the NetNutrition home page.")
+
+        # The session pool keeps this from swamping NetNutrition
+        async def load(unit):
+            try:
+                return unit, await self._dining_hours.refresh(unit)
+            except (HoursError, aiohttp.ClientError, asyncio.TimeoutError):
+                return unit, None
+
+        return {unit: hours for unit, hours in await asyncio.gather(*map(load, units)) if hours is not None}
 
-        blocks = soup.find_all("table", class_="table hours-table")
-        footers = {block.find("th").get_text(): block.find("td").get_text().split("  ")[0] for block in blocks}
-        hours = {block.find("th").get_text(): {
-            Day(day.get_text().strip()[:3]): [tuple(to_time(span) for span in time.get_text().strip().split("-"))]
-            if time.get_text().strip().lower() != "closed" else ["Closed"]
-            for day, time in zip(block.find_all("th")[1:], block.find_all("td")[1:])}
-            for block in blocks}
+    async def refresh_library_hours(self):
+        # Catches mid-week edits too
+        try:
+            await self._library_hours.refresh()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            print("VandyBot could not access the library hours.")
 
-        return hours[library], footers[library]
+        self._bot.loop.create_task(schedule(self.refresh_library_hours, self.SCHEDULE))
 
     async def startup(self):
         print("Starting the Hours cog...")
+        self._bot.loop.create_task(schedule(self.refresh_library_hours, self.SCHEDULE))
 
-    async def reset(self):
+    async def reset(self, session):
         # Because POST requests are bad and should feel bad
-        await self._session.post(self.DINING_URL + "/Home/ResetSelections", headers=self.DINING_HEADER)
+        async with session.post(self.DINING_URL + "/Home/ResetSelections", headers=self.DINING_HEADER):
+            pass
 
     @commands.command(name="hours",
                       brief="Gets the operating hours for various on-campus facilities",
@@ -171,7 +261,7 @@ class Hours(commands.Cog):
                             "~hours list")
     async def hours(self, ctx, *args):
         if args and args[0] == "list":
-            await ctx.send(embed=self.hours_list())
+            await outbox.send(ctx, embed=self.hours_list())
         else:
             locs, days = self.hours_parse(args)
             for loc in locs:
@@ -206,7 +296,7 @@ class Hours(commands.Cog):
                         "{} to {}".format(*span) for span in loc_hours)}
                     footer = self.hours_footer(loc, footer)
                     embed = self.generate_embed(title=unit_name(loc), url=url, fields=fields, footer=footer)
-                    await ctx.send(embed=embed)
+                    await outbox.send(ctx, embed=embed)
 
     def hours_footer(self, loc: str, default: str):
         condition = self._loc_conditions.get(loc, "")
@@ -217,6 +307,26 @@ class Hours(commands.Cog):
         else:
             return default
 
+    @commands.command(name="hours-cache",
+                      hidden=True,
+                      help="Shows NetNutrition cache statistics, or refreshes every cached entry.",
+                      usage="[refresh]")
+    @commands.is_owner()
+    async def hours_cache(self, ctx, *args):
+        if args and args[0].lower() == "refresh":
+            await self._unit_oids.refresh()
+            await self._library_hours.refresh()
+            for unit in list(self._dining_hours.keys()):
+                await self._dining_hours.refresh(unit)
+
+        fields = {"Unit OIDs": joiner([f"{count} {name}" for name, count in self._unit_oids.stats.items()]),
+                  "Dining Hours": joiner([f"{count} {name}" for name, count in self._dining_hours.stats.items()]),
+                  "Library Hours": joiner([f"{count} {name}" for name, count in self._library_hours.stats.items()])}
+        embed = self.generate_embed(title="NetNutrition Cache", url=self.DINING_URL, fields=fields,
+                                    footer=f"{len(self._dining_hours)} units cached; sessions: {self._sessions}; "
+                                           f"{single_flight}")
+        await outbox.send(ctx, embed=embed)
+
     def hours_from_dining(self, unit: str):
         async def dispatcher(ctx, hour_arg: str, *args):
             if hour_arg.lower() != "hours":
@@ -259,55 +369,17 @@ class Hours(commands.Cog):
         # Args can be in any order
         for arg in args:
             arg = reduce(arg)
-            try:
-                # Is a dining unit?
-                locs.append(self._dining[arg])
-                continue
-            except KeyError:
-                pass
-
-            try:
-                # Is a library?
-                locs.append(self._libraries[arg])
-                continue
-            except KeyError:
-                pass
-
-            try:
-                # Is the post office?
-                locs.append(self._post_offices[arg])
-                continue
-            except KeyError:
-                pass
-
-            try:
-                # Is the bookstore?
-                locs.append(self._bookstores[arg])
-                continue
-            except KeyError:
-                pass
-
-            try:
-                # Is the rec?
-                locs.append(self._recs[arg])
-                continue
-            except KeyError:
-                pass
-
-            # Is a day?
-            if arg == "today":
-                days.append(today())
-            elif arg == "tomorrow":
-                days.append(tomorrow())
+            if arg == "library":
+                # Heh heh
+                raise commands.BadArgument("Which one, smartass?") from None
+
+            kind, value = resolver.resolve(arg, self.ARG_KINDS)
+            if kind == "relative day":
+                days.append(value())
+            elif kind == "day":
+                days.append(value)
             else:
-                try:
-                    days.append(Day(arg))
-                except ValueError:
-                    if arg == "library":
-                        # Heh heh
-                        raise commands.BadArgument("Which one, smartass?") from None
-                    else:
-                        raise commands.BadArgument(f"Invalid argument provided: {arg}") from None
+                locs.append(value)
 
         if not locs:
             raise commands.BadArgument("No facility was provided.") from None
@@ -319,10 +391,6 @@ class Hours(commands.Cog):
 
         return locs, days
 
-    @hours.after_invoke
-    async def hours_reset(self, *_):
-        await self.reset()
-
     async def on_raw_reaction_add(self, payload):
         pass
 